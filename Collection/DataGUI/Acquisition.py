@@ -0,0 +1,236 @@
+"""Helpers that pace and check data drained from the board"""
+import numpy as np
+
+from collections import deque
+from SessionIO import InfoJournal
+from threading import Lock
+from time import perf_counter
+
+
+class DrainScheduler:
+    """
+    Decides when to drain the board's ring buffer and how many samples to take
+
+    The wait between drains is chosen so the buffer fills to target_fill of its size before the next drain. Samples
+    are drained in batches of a fixed size (at most max_interval worth of samples); any remainder smaller than a
+    batch stays on the board until next time.
+
+    Parameters
+    ----------
+    buffsize: int
+        Size of the board ring buffer in samples (passed to BoardShim.start_stream)
+    sample_rate: float
+        Sampling rate of the board in Hz
+    target_fill: float
+        Fraction of the buffer to let fill between drains
+    warn_fill: float
+        Fraction of the buffer at which near_overflow() reports true
+    max_interval: float
+        Longest wait between drains in seconds
+    """
+    min_interval = 0.05
+
+    def __init__(self, buffsize, sample_rate, target_fill=0.25, warn_fill=0.8, max_interval=10.0):
+        self.buffsize = buffsize
+        self.sample_rate = sample_rate
+        self.target = max(1, int(buffsize * target_fill))
+        self.warn = int(buffsize * warn_fill)
+        self.max_interval = max_interval
+        self.batch = max(1, min(int(sample_rate), self.target, int(sample_rate * max_interval)))
+
+    def next_wait(self, count):
+        """Seconds to wait before the next drain, given count samples still in the buffer"""
+        wait = (self.target - count) / self.sample_rate
+        return min(self.max_interval, max(self.min_interval, wait))
+
+    def batches(self, count, final=False):
+        """Sizes of the batches to drain from count buffered samples. A final drain also takes the remainder."""
+        full, rest = divmod(int(count), self.batch)
+        sizes = [self.batch] * full
+        if final and rest:
+            sizes.append(rest)
+        return sizes
+
+    def near_overflow(self, count):
+        return count >= self.warn
+
+    def fill(self, count):
+        """Fraction of the buffer in use"""
+        return count / self.buffsize
+
+
+class ContinuityChecker:
+    """
+    Detects lost samples in drained data using the board's package counter and timestamp channels
+
+    The package counter increases by a fixed step per sample and wraps at counter_mod. Steps larger than that are
+    counted as lost packets. Consecutive timestamps further apart than gap_seconds (or 4 sample periods, whichever
+    is longer) are counted as gaps.
+
+    Parameters
+    ----------
+    package_channel: int
+        Row of the package counter (BoardShim.get_package_num_channel)
+    timestamp_channel: int
+        Row of the timestamps (BoardShim.get_timestamp_channel)
+    sample_rate: float
+        Sampling rate of the board in Hz
+    step: int
+        Counter increase per sample. Inferred from the first chunk if None.
+    """
+    counter_mod = 256
+    gap_seconds = 0.1
+
+    def __init__(self, package_channel, timestamp_channel, sample_rate, step=None):
+        self.pchan = package_channel
+        self.tchan = timestamp_channel
+        self.sample_rate = sample_rate
+        self.step = step
+        self.gap_threshold = max(self.gap_seconds, 4 / sample_rate)
+        self.last_package = self.first_time = self.last_time = None
+        self.samples = self.lost = self.gaps = 0
+        self.longest_gap = 0.0
+
+    def check(self, chunk):
+        """Update counts with (rows, n) chunk. Returns number of packets lost within and before the chunk."""
+        if not chunk.shape[1]:
+            return 0
+        packages = chunk[self.pchan].astype(np.int64)
+        times = chunk[self.tchan]
+        if self.last_package is not None:
+            packages = np.concatenate(([self.last_package], packages))
+            times = np.concatenate(([self.last_time], times))
+        else:
+            self.first_time = times[0]
+
+        lost = 0
+        if len(packages) > 1:
+            steps = np.diff(packages) % self.counter_mod
+            if self.step is None:
+                self.step = max(1, int(np.bincount(steps).argmax()))
+            lost = int(np.sum(np.maximum(steps // self.step - 1, 0)))
+            dt = np.diff(times)
+            gaps = dt[dt > self.gap_threshold]
+            self.gaps += len(gaps)
+            if len(gaps):
+                self.longest_gap = max(self.longest_gap, float(gaps.max()))
+
+        self.lost += lost
+        self.samples += chunk.shape[1]
+        self.last_package, self.last_time = packages[-1], times[-1]
+        return lost
+
+    def effective_rate(self):
+        """Sampling rate measured from timestamps"""
+        if self.samples < 2 or self.last_time == self.first_time:
+            return 0.0
+        return (self.samples - 1) / (self.last_time - self.first_time)
+
+    def summary(self):
+        """Summary for info.json (values are strings per info.json conventions)"""
+        expected = self.samples + self.lost
+        return {
+            "Samples": str(self.samples),
+            "LostPackets": str(self.lost),
+            "LossPercent": f"{100 * self.lost / expected if expected else 0:.3f}",
+            "Gaps": str(self.gaps),
+            "LongestGap": f"{self.longest_gap:.3f}",
+            "EffectiveSampleRate": f"{self.effective_rate():.3f}"
+        }
+
+
+class SessionStats:
+    """
+    Tracks acquisition performance of a collection session
+
+    Drain figures are recorded by the collection thread; snapshot() may be called from any thread and combines them
+    with the writer thread's stats. The sample rate is measured over at least the last rate_window seconds.
+    """
+    rate_window = 10.0
+
+    def __init__(self):
+        self.lock = Lock()
+        self.start_time = None
+        self.history = deque()  # (time, total samples) at each drain
+        self.samples = 0
+        self.rate = 0.0
+        self.drain_latency = 0.0
+        self.max_drain_latency = 0.0
+        self.fill = 0.0
+        self.lost = 0
+        self.on_drain = None  # Called from the collection thread with the arguments of every record_drain
+
+    def start(self):
+        with self.lock:
+            self.start_time = perf_counter()
+            self.history.append((self.start_time, 0))
+
+    def record_drain(self, samples, latency, fill, lost=0):
+        """Record one drain of samples that took latency seconds with the buffer at fill fraction"""
+        now = perf_counter()
+        with self.lock:
+            self.samples += int(samples)
+            self.history.append((now, self.samples))
+            while len(self.history) > 2 and self.history[1][0] <= now - self.rate_window:
+                self.history.popleft()
+            then, before = self.history[0]
+            if now > then:
+                self.rate = (self.samples - before) / (now - then)
+            self.drain_latency = latency
+            self.max_drain_latency = max(self.max_drain_latency, latency)
+            self.fill = float(fill)
+            self.lost += int(lost)
+        if self.on_drain:
+            self.on_drain(samples, latency, fill, lost)
+
+    def snapshot(self, writer_stats=None):
+        """Current figures as a flat dict of numbers. Latencies in ms."""
+        with self.lock:
+            snap = {
+                "elapsed": round(perf_counter() - self.start_time, 3) if self.start_time else 0.0,
+                "samples": self.samples,
+                "samples_per_sec": round(self.rate, 2),
+                "drain_ms": round(1000 * self.drain_latency, 3),
+                "max_drain_ms": round(1000 * self.max_drain_latency, 3),
+                "buffer_fill": round(self.fill, 4),
+                "lost": self.lost
+            }
+        if writer_stats:
+            snap["write_ms"] = round(1000 * writer_stats["last_write_time"], 3)
+            snap["max_write_ms"] = round(1000 * writer_stats["max_write_time"], 3)
+            snap["bytes_written"] = writer_stats["bytes"]
+            snap["queue_depth"] = writer_stats["depth"]
+            snap["blocked_puts"] = writer_stats["blocked_puts"]
+        return snap
+
+
+class MarkerCodes:
+    """
+    Assigns numeric marker codes to event labels for the board's marker channel
+
+    Codes start at 1 (0 means no marker) and are given out in order of first use. Each new code is journaled to
+    markercodes.jsonl like annotations, and compact() writes the table into info.json under MarkerCodes as a list
+    of [code, label] pairs when the session ends.
+
+    Parameters
+    ----------
+    infopath: str
+        Path to info.json including filename
+    """
+    def __init__(self, infopath):
+        self.infopath = infopath
+        self.codes = {}
+        self.lock = Lock()
+        self.journal = InfoJournal(infopath, "MarkerCodes", "markercodes.jsonl")
+
+    def code(self, label):
+        """Marker code for label, adding it to the table if new"""
+        with self.lock:
+            if label not in self.codes:
+                self.codes[label] = len(self.codes) + 1
+                self.journal.append([self.codes[label], label])
+            return self.codes[label]
+
+    def compact(self):
+        """Write the codes given out so far into info.json"""
+        self.journal.compact()
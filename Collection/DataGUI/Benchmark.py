@@ -0,0 +1,200 @@
+"""Acquisition benchmarks of CollectionSession against BrainFlow's synthetic board and the simulator"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import BoardBridge
+import BoardlessBridge
+
+from brainflow import BrainFlowInputParams
+from brainflow.board_shim import BoardShim, BoardIds
+from SessionIO import create_empty_info
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is reported as None
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)  # Bytes on macOS, KB on Linux
+
+
+def summary(times):
+    """Mean, median, 95th percentile, and maximum of times (seconds) in ms"""
+    if not times:
+        return {"n": 0, "mean": None, "p50": None, "p95": None, "max": None}
+    ms = 1000 * np.asarray(times)
+    return {"n": len(ms), "mean": round(float(ms.mean()), 3), "p50": round(float(np.percentile(ms, 50)), 3),
+            "p95": round(float(np.percentile(ms, 95)), 3), "max": round(float(ms.max()), 3)}
+
+
+class BenchSession(BoardlessBridge.CollectionSession):
+    """Simulator session without the preparation delay, releasing samples at sim_speed times real time"""
+    sim_prep_time = 0
+    sim_seed = 0
+    sim_speed = 1
+
+    def create_sim(self, bid):
+        sim = super().create_sim(bid)
+        sim.speed = self.sim_speed
+        return sim
+
+
+def run_config(config):
+    """
+    Record one session and measure it
+
+    Parameters
+    ----------
+    config: dict
+        source ("synthetic" for BrainFlow's synthetic board through BoardBridge, "sim" for DataSim through
+        BoardlessBridge), board (BoardIds name, whose row layout the simulator follows), rate (simulated samples per
+        second), speed (multiple of real time the simulator runs at), buffsize (on-board buffer in samples), and
+        seconds (streaming time)
+    """
+    bid = BoardIds[config["board"]].value if config["source"] == "sim" else BoardIds.SYNTHETIC_BOARD.value
+    rate = config["rate"] if config["source"] == "sim" else BoardShim.get_sampling_rate(bid)
+    sespath = tempfile.mkdtemp(prefix="bench_")
+    info = create_empty_info()
+    # Simulated session length, so the SampleStore is preallocated for every sample
+    info["SessionParams"].update({"BlockLength": str(int(np.ceil(config["seconds"] * config["speed"]))),
+                                  "BlockCount": "1", "StimCycle": "1"})
+    info["HardwareParams"].update({"SampleRate": str(rate), "BufferSize": str(config["buffsize"])})
+    with open(os.path.join(sespath, "info.json"), 'w') as f:
+        json.dump(info, f)
+
+    if config["source"] == "sim":
+        session_cls = type("BenchSession", (BenchSession,), {"sim_rate": rate, "sim_speed": config["speed"]})
+    else:
+        session_cls = BoardBridge.CollectionSession
+    board = BoardShim(bid, BrainFlowInputParams())
+    session = session_cls(board, sespath, config["buffsize"])
+    session.activate_logger(os.path.join(sespath, "sessionlog.log"))
+
+    # Drain latency per tick is what update_data passes to SessionStats; write latency is timed per appended chunk
+    drains, fills, writes = [], [], []
+
+    def record(samples, latency, fill, lost):
+        drains.append(latency)
+        fills.append(fill)
+    session.stats.on_drain = record
+    session.writer.on_append = writes.append
+
+    session.start()
+    session.control.wait(session.ready_flag, session.error_flag)
+    session.start_event.set()
+    session.control.wait(session.ongoing, session.error_flag)
+    session.control.wait(session.error_flag, timeout=config["seconds"])
+    stats = session.get_stats()
+    stop = perf_counter()
+    session.stop_event.set()
+    session.join()
+    stop_time = perf_counter() - stop
+    if board.is_prepared():
+        board.release_session()
+
+    files = {name: os.path.getsize(os.path.join(sespath, name)) for name in sorted(os.listdir(sespath))}
+    result = dict(config, board_id=bid, rows=BoardShim.get_num_rows(bid),
+                  eeg_channels=len(BoardShim.get_eeg_channels(bid)), sample_rate=rate,
+                  error=session.get_error() or None,
+                  samples=session.data.count,
+                  samples_per_sec=round(session.data.count / config["seconds"], 2),
+                  lost=stats["lost"],
+                  max_buffer_fill=round(float(max(fills, default=0.0)), 4),
+                  drain_ms=summary(drains),
+                  write_ms=summary(writes),
+                  stop_ms=round(1000 * stop_time, 3),
+                  peak_rss_mb=peak_rss_mb(),
+                  disk_bytes=sum(files.values()),
+                  files=files)
+    shutil.rmtree(sespath, ignore_errors=True)
+    return result
+
+
+def configs(args):
+    """Every combination of the swept parameters for each selected source"""
+    for source in args.sources:
+        boards = args.boards if source == "sim" else [BoardIds.SYNTHETIC_BOARD.name]
+        rates = args.rates if source == "sim" else [None]
+        speeds = args.speeds if source == "sim" else [1]
+        for board, rate, speed, buffsize, seconds in itertools.product(boards, rates, speeds, args.buffsizes,
+                                                                       args.seconds):
+            yield {"source": source, "board": board, "rate": rate, "speed": speed, "buffsize": buffsize,
+                   "seconds": seconds}
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def csv_list(cast):
+    return lambda text: [cast(v) for v in text.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='Benchmark.py',
+                                     description='Measures drain and write latency, peak memory, and disk usage of '
+                                                 'collection sessions over a sweep of board layouts, sample rates, '
+                                                 'buffer sizes, and session lengths. Results are JSON.')
+    parser.add_argument('--sources', type=csv_list(str), default=["synthetic", "sim"],
+                        help="Comma separated: synthetic (BrainFlow synthetic board), sim (simulator at --speeds)")
+    parser.add_argument('--boards', type=csv_list(str), default=["CYTON_BOARD", "FREEEEG32_BOARD", "FREEEEG128_BOARD"],
+                        help="BoardIds names whose row layouts the simulator follows (sweeps channel counts)")
+    parser.add_argument('--rates', type=csv_list(int), default=[250, 2000],
+                        help="Simulated sample rates in Hz")
+    parser.add_argument('--speeds', type=csv_list(float), default=[1.0, 8.0],
+                        help="Multiples of real time the simulator releases samples at (load beyond the rate)")
+    parser.add_argument('--buffsizes', type=csv_list(int), default=[3000, 45000],
+                        help="On-board buffer sizes in samples")
+    # Drains happen when the buffer is a quarter full (at most every 10 s), so sessions need several seconds to
+    # give more than the final drain
+    parser.add_argument('--seconds', type=csv_list(float), default=[20.0], help="Streaming time of each session")
+    parser.add_argument('--out', help="File to write the results to (stdout if not given)")
+    parser.add_argument('--run', help=argparse.SUPPRESS)  # One config as JSON, run in a child process
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_config(json.loads(args.run))), flush=True)
+        sys.exit(0)
+
+    # Each session runs in its own process so peak RSS belongs to that configuration alone
+    results = []
+    for config in configs(args):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", json.dumps(config)],
+                              capture_output=True, text=True)
+        lines = proc.stdout.strip().splitlines()
+        try:
+            result = json.loads(lines[-1])
+        except (IndexError, json.JSONDecodeError):
+            result = dict(config, error=proc.stderr.strip()[-500:] or f"Exit code {proc.returncode}")
+        results.append(result)
+        print(f"{config} -> drain p95 {result.get('drain_ms', {}).get('p95')} ms, "
+              f"write p95 {result.get('write_ms', {}).get('p95')} ms, rss {result.get('peak_rss_mb')} MB",
+              file=sys.stderr)
+
+    report = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+              "numpy": np.__version__, "results": results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
@@ -1,25 +1,43 @@
 """Classes that integrate Brainflow functionality into the GUI"""
+from Acquisition import ContinuityChecker, DrainScheduler, SessionStats
 from brainflow import LogLevels, BrainFlowError
 from brainflow.board_shim import BoardShim
-from threading import Thread, Event, Lock
-from time import sleep
+from Filters import StreamFilter
+from LiveStream import StreamServer, stream_metadata
+from SharedRing import SharedRing
+from SessionControl import SessionControl, PREPARING, READY, STREAMING, STOPPED, ERROR
+from SessionIO import BinaryWriter, SampleStore, WriterThread, expected_samples, export_csv, update_info
+from threading import Thread, Lock
+from time import perf_counter, time
 
-import numpy as np
+import json
 import os
 
 
 class ExceptableThread(Thread):
+    """Thread that keeps the exception raised by its target and sets event done when finished"""
+    def __init__(self, *args, done=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.done = done
+
     def run(self):
         self.exc = None
         try:
             self.ret = self._target(*self._args, **self._kwargs)
         except BaseException as e:
             self.exc = e
+        finally:
+            if self.done:
+                self.done.set()
 
 
 class CollectionSession(Thread):
     """
     Handles board setup and communication with GUI threads
+
+    The session thread moves through the states in SessionControl (Preparing, Ready, Streaming, then Stopped or
+    Error), blocking on the control's events in between instead of polling. Functions added with add_listener are
+    called with each new state from the session thread.
     
     Parameters
     ----------
@@ -28,24 +46,94 @@ class CollectionSession(Thread):
     sespath: str
         Path to directory where data, info, and log files will be stored
     buffsize: Size of on-board data buffer in samples
+    fname: str
+        Name of the data files without extension
+    label: str
+        Tag added to log messages to tell boards apart in multi-board sessions
+    control: SessionControl
+        Start, stop, and error events shared with other sessions; a new one is created if None
+    stream_port: int
+        Local TCP port to publish drained data on (see LiveStream); no stream if None
+    ring_name: str
+        Shared memory name of a ring buffer holding the latest ring_seconds of data (see SharedRing); no ring if None
+    ring_seconds: float
+        Length of the shared memory ring buffer
+    filters: dict
+        Keyword arguments of a Filters.StreamFilter applied to the EEG rows of each drained chunk; no filtering if
+        None. Filtered data is written to <fname>_filtered.bin and is what the live stream and ring carry.
     """
     class PrepInterruptedException(Exception):
         """Raised by user closing the window during board preparation."""
 
-    def __init__(self, boardshim: BoardShim, sespath, buffsize):
-        super().__init__(name="CollectionThread")
+    live_interval = 0.1  # Longest wait between drains while data is shared with live consumers
+    save_log_interval = 5  # Minimum seconds between "Update saved." log lines
+
+    def __init__(self, boardshim: BoardShim, sespath, buffsize, fname="data", label=None, control=None,
+                 stream_port=None, ring_name=None, ring_seconds=30, filters=None):
+        super().__init__(name="CollectionThread" if not label else f"CollectionThread-{label}")
         self.lock = Lock()
         self.board = boardshim
         self.buffsize = buffsize
         self.sespath = sespath
-        self.fname = "data.csv"
-        self.ready_flag, self.ongoing, self.error_flag = Event(), Event(), Event()
-        self.start_event, self.stop_event = Event(), Event()
+        self.fname = fname + ".bin"
+        self.csvname = fname + ".csv"
+        self.label = label
+        self.control = control or SessionControl()
+        self.start_event, self.stop_event, self.error_flag = (self.control.start_event, self.control.stop_event,
+                                                              self.control.error_flag)
+        self.ready_flag, self.ongoing = self.control.event(), self.control.event()
+        self.state = PREPARING
+        self.listeners = []
         self.error_message = ""
         self.lfpath = None
+        self.stream_start = None
+        self.marker_lock = Lock()
+        self.held_markers = []  # Markers sent before the stream started
+
+        bid = self.board.board_id
+        rows = BoardShim.get_num_rows(bid)
+        srate = BoardShim.get_sampling_rate(bid)
+        self.infopath = os.path.join(self.sespath, "info.json")
+        self.data = SampleStore(rows, expected_samples(self.infopath))
+        # Disk writes run on their own thread so slow storage does not delay draining the board
+        self.writer = WriterThread(BinaryWriter(os.path.join(self.sespath, self.fname), rows, bid, srate),
+                                   on_write=self.log_saved)
+        # Live consumers (stream or shared ring) need new data within a fraction of a second
+        live = stream_port is not None or ring_name is not None
+        self.scheduler = DrainScheduler(buffsize, srate, max_interval=self.live_interval if live else 10.0)
+        self.checker = ContinuityChecker(BoardShim.get_package_num_channel(bid), BoardShim.get_timestamp_channel(bid),
+                                         srate)
+        self.pending = 0  # Samples left on the board after the last drain
+        self.stats = SessionStats()
+        self.stats_interval = 30  # Seconds between STATS log lines
+        self.last_stats_log = 0
+        self.last_save_log = 0
+        self.stream_port = stream_port
+        self.stream = None
+        self.ring_name = ring_name
+        self.ring_seconds = ring_seconds
+        self.ring = None
+        self.filter = self.filtered_writer = None
+        if filters is not None:
+            self.filter = StreamFilter(BoardShim.get_eeg_channels(bid), srate, **filters)
+            self.filtered_writer = WriterThread(BinaryWriter(os.path.join(self.sespath, fname + "_filtered.bin"),
+                                                             rows, bid, srate))
 
-        rows = BoardShim.get_num_rows(self.board.board_id)
-        self.data = np.zeros((rows, 1))
+    def add_listener(self, callback):
+        """Call callback(state) on every state change"""
+        self.listeners.append(callback)
+
+    def set_state(self, state):
+        self.state = state
+        self.control.notify()
+        for callback in self.listeners:
+            callback(state)
+
+    def abort(self):
+        """End the session from any state (e.g. when the GUI is closed). Data already drained is kept."""
+        if not self.error_message:
+            self.error_message = "Error: Session aborted."
+        self.error_flag.set()
 
     def activate_logger(self, fpath):
         """Configure board logger to accept custom messages and log at INFO"""
@@ -55,6 +143,8 @@ class CollectionSession(Thread):
 
     def log_message(self, level, message):
         """Log custom message"""
+        if self.label:
+            message = message.replace("[GUI]", f"[GUI] [{self.label}]", 1)
         with self.lock:
             self.board.log_message(level, message)
 
@@ -62,18 +152,22 @@ class CollectionSession(Thread):
         """Prepare board for collection. Sets error flag upon failure, ready flag on success."""
         if self.board.is_prepared():
             self.ready_flag.set()
+            self.set_state(READY)
             return
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Preparing board...")
         try:
             # ExceptableThread allows calling thread to access exceptions encountered in child thread
-            proc = ExceptableThread(target=self.board.prepare_session, daemon=True, name="PrepThread")
+            prepared = self.control.event()
+            proc = ExceptableThread(target=self.board.prepare_session, daemon=True, name="PrepThread", done=prepared)
             proc.start()
-            while proc.is_alive():  # Checks for interruption by threads other than PrepThread (probably a window close)
-                if self.stop_event.is_set() or self.error_flag.is_set():
-                    raise CollectionSession.PrepInterruptedException("Board preparation interrupted.")
+            # Wakes when PrepThread finishes or another thread interrupts (probably a window close)
+            self.control.wait(prepared, self.stop_event, self.error_flag)
+            if not prepared.is_set():
+                raise CollectionSession.PrepInterruptedException("Board preparation interrupted.")
             if self.board.is_prepared():
                 self.ready_flag.set()
                 self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Board preparation successful.")
+                self.set_state(READY)
             else:
                 raise proc.exc if proc.exc else Exception("Unknown error. Check logs.")
         except BrainFlowError as E:
@@ -92,65 +186,320 @@ class CollectionSession(Thread):
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Stream started.")
         if not self.ready_flag.is_set():
             return
-        self.board.start_stream()  # Uncomment
+        self.board.start_stream(self.buffsize)
+        self.stream_start = time()
+        self.writer.start()
+        if self.filter:
+            self.filtered_writer.start()
+            update_info(self.infopath, "Filters",
+                        dict(self.filter.settings(), File=os.path.basename(self.filtered_writer.path)), self.label)
+        self.stats.start()
+        self.last_stats_log = perf_counter()
+        if self.stream_port is not None:
+            self.start_live_stream()
+        if self.ring_name is not None:
+            self.create_ring()
 
-    def update_data(self):
+    def start_live_stream(self):
+        """Publish drained data to local clients. Collection goes on without it if the port is unavailable."""
+        meta = stream_metadata(self.board.board_id, self.checker.sample_rate, self.label)
+        meta["filters"] = self.filter.settings() if self.filter else None
         try:
-            if not self.data.any():
-                self.data = self.board.get_board_data()  # Uncomment
-            else:
-                self.data = np.hstack((self.data, self.board.get_board_data()))
-            self.save_data()
-        except BrainFlowError as E:
+            self.stream = StreamServer(meta, self.stream_port)
+        except OSError as E:
+            self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Live stream not started - {E}")
+            return
+        self.stream.start()
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Live stream on {self.stream.host}:{self.stream.port}.")
+
+    def insert_marker(self, code):
+        """
+        Write code into the board's marker channel at the current sample. Codes sent after the session is started
+        but before the stream is running are held and inserted once it is. Returns whether the code was accepted.
+        """
+        with self.marker_lock:
+            if not self.ongoing.is_set():
+                if self.start_event.is_set() and not self.stop_event.is_set():
+                    self.held_markers.append(code)
+                    return True
+                return False
+            try:
+                self.board.insert_marker(code)
+            except BrainFlowError as E:
+                self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Marker {code} not inserted - {E}")
+                return False
+            return True
+
+    def create_ring(self):
+        """Share the latest data with local processes. Collection goes on without it if it cannot be created."""
+        capacity = int(self.ring_seconds * self.checker.sample_rate)
+        try:
+            self.ring = SharedRing.create(self.ring_name, self.data.rows, capacity, self.checker.sample_rate)
+        except OSError as E:
+            self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Shared memory ring not created - {E}")
+            return
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Shared memory ring '{self.ring_name}' holds the latest "
+                                               f"{self.ring_seconds}s of data.")
+
+    def update_data(self, final=False):
+        """Drain buffered samples in scheduler-sized batches. A final drain empties the buffer."""
+        try:
+            start = perf_counter()
+            count = self.board.get_board_data_count()
+            if self.scheduler.near_overflow(count):
+                self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Board buffer {self.scheduler.fill(count):.0%} full. "
+                                                       "Data may be lost if draining falls further behind.")
+            fill = self.scheduler.fill(count)
+            lost = 0
+            sizes = self.scheduler.batches(count, final)
+            for i, size in enumerate(sizes):
+                chunk = self.board.get_board_data(size)
+                lost += self.checker.check(chunk)
+                self.data.append(chunk)
+                live = chunk
+                if self.filter:
+                    live = self.filter.apply(chunk)
+                    self.filtered_writer.put(live)
+                if self.ring:
+                    self.ring.write(live)
+                if self.stream:
+                    self.stream.publish(live)
+                self.save_data(chunk, notify=i == len(sizes) - 1)
+                count -= size
+            self.pending = count
+            self.stats.record_drain(sum(sizes), perf_counter() - start, fill, lost)
+            if lost:
+                self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: {lost} packets lost since last drain.")
+            if perf_counter() - self.last_stats_log >= self.stats_interval:
+                self.log_stats()
+            if exc := self.writer.exc or (self.filtered_writer and self.filtered_writer.exc):
+                self.error_message = f"Error: {exc}"
+                self.error_flag.set()
+        except BrainFlowError as E:  # run() ends the session once it sees the error flag
             self.error_message = f"Error: {E}"
             self.error_flag.set()
-            self.end_session()
+
+    def save_data(self, chunk, notify=True):
+        """Queue newly drained samples for the writer thread. The last chunk of a drain logs once written."""
+        self.writer.put(chunk, notify)
+
+    def log_saved(self, nbytes):
+        if perf_counter() - self.last_save_log >= self.save_log_interval:
+            self.last_save_log = perf_counter()
+            self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Update saved.")
+
+    def get_stats(self):
+        """Snapshot of acquisition performance figures (see Acquisition.SessionStats)"""
+        return self.stats.snapshot(self.writer.get_stats())
+
+    def log_stats(self):
+        """Log performance figures as a single JSON object after a 'STATS' tag"""
+        self.last_stats_log = perf_counter()
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: STATS {json.dumps(self.get_stats())}")
+
+    def close_files(self):
+        """Flush queued data, close data file, and export data.csv from it"""
+        if self.writer.closed:
             return
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        if self.stream:
+            self.stream.close()
+            if self.stream.dropped:
+                self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: {self.stream.dropped} live stream clients "
+                                                       "disconnected for falling behind.")
+        self.writer.close()
+        if self.filtered_writer:
+            self.filtered_writer.close()
+        self.log_stats()
+        stats = self.writer.get_stats()
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Writer stats - chunks: {stats['chunks']}, "
+                                               f"bytes: {stats['bytes']}, max queue depth: {stats['max_depth']}, "
+                                               f"blocked puts: {stats['blocked_puts']} "
+                                               f"({stats['blocked_time']:.3f}s)")
+        export_csv(self.writer.path, os.path.join(self.sespath, self.csvname))
 
-    def save_data(self):
-        np.savetxt(os.path.join(self.sespath, self.fname), np.copy(self.data), fmt="%.9f")
-        self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Update saved.")
+        summary = self.checker.summary()
+        self.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Acquisition summary - {summary['Samples']} samples, "
+                                               f"{summary['LostPackets']} lost packets ({summary['LossPercent']}%), "
+                                               f"{summary['Gaps']} gaps (longest {summary['LongestGap']}s), "
+                                               f"effective rate {summary['EffectiveSampleRate']} Hz")
+        update_info(self.infopath, "AcquisitionSummary", summary, self.label)
 
     def run(self):
         self.prepare()
 
-        while not self.start_event.is_set() and not self.error_flag.is_set():  # In ready state
-            sleep(0.1)
+        self.control.wait(self.start_event, self.error_flag)  # In ready state
         if self.error_flag.is_set():  # Probably window closed before starting stream
             if self.board.is_prepared():
                 self.board.release_session()
+            self.writer.close()
+            if self.filtered_writer:
+                self.filtered_writer.close()
+            self.set_state(ERROR)
             return
 
         self.start_stream()
-        self.ongoing.set()
+        with self.marker_lock:
+            for held in self.held_markers:
+                try:
+                    self.board.insert_marker(held)
+                except BrainFlowError as E:
+                    self.log_message(LogLevels.LEVEL_WARN, f"[GUI]: Marker {held} not inserted - {E}")
+            self.held_markers.clear()
+            self.ongoing.set()
+        self.set_state(STREAMING)
 
-        stopped = False
-        while not (error := self.error_flag.is_set()) and not (stopped := self.stop_event.is_set()):
-            sleep(5)
+        # Drain when the scheduler says so; a stop or error wakes the wait immediately
+        while not self.control.wait(self.stop_event, self.error_flag, timeout=self.scheduler.next_wait(self.pending)):
             self.update_data()
 
-        if error:  # Error during collection (window close counted as error)
+        if self.error_flag.is_set():  # Error during collection (window close counted as error)
             self.end_session()
-            return
-        if stopped:  # Stopped by user or natural end of session
-            self.pause_session()  # Change to pause_session
+        else:  # Stopped by user or natural end of session
+            self.pause_session()
 
     def pause_session(self):
+        self.update_data(final=True)  # Collect samples taken since the last drain
         self.board.stop_stream()
+        self.close_files()
         self.ready_flag.clear()
         self.ongoing.clear()
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Stream stopped.")
+        self.set_state(STOPPED)
 
     def end_session(self):
-        self.save_data()
+        self.close_files()
         self.board.stop_stream()
         self.board.release_session()
         self.ready_flag.clear()
         self.ongoing.clear()
         self.log_message(LogLevels.LEVEL_INFO, "[GUI]: Session ended.")
+        self.set_state(ERROR)
 
     def get_error(self):
         return self.error_message
 
     def get_flags(self):
         return (self.ready_flag, self.ongoing, self.error_flag), (self.start_event, self.stop_event)
+
+
+class MultiBoardSession(Thread):
+    """
+    Records several boards at once, each with its own CollectionSession (drain, writer, and files)
+
+    The sessions share start, stop, and error events, so all streams start and stop together and an error on one
+    board ends the whole session. BrainFlow timestamps all boards with the same host clock, so their data files
+    can be aligned on the timestamp channel. Exposes the same interface to the GUI as CollectionSession.
+
+    Parameters
+    ----------
+    boardshims: list
+        BoardShim objects, one per board
+    sespath: str
+        Path to directory where data, info, and log files will be stored
+    buffsize: int
+        Size of on-board data buffer in samples (per board)
+    session_cls: type
+        CollectionSession class to run each board with
+    stream_port: int
+        Live stream port of the first board; board i streams on stream_port + i. No streams if None.
+    ring_name: str
+        Shared memory ring name of the first board; board i uses ring_name_i. No rings if None.
+    filters: dict
+        Online filter settings applied to every board (see CollectionSession)
+    """
+    def __init__(self, boardshims, sespath, buffsize, session_cls=CollectionSession, stream_port=None,
+                 ring_name=None, filters=None):
+        super().__init__(name="MultiCollectionThread")
+        self.control = SessionControl()
+        self.start_event, self.stop_event, self.error_flag = (self.control.start_event, self.control.stop_event,
+                                                              self.control.error_flag)
+        self.ready_flag, self.ongoing = self.control.event(), self.control.event()
+        self.state = PREPARING
+        self.listeners = []
+        self.infopath = os.path.join(sespath, "info.json")
+        # First board keeps the single-board file names so existing tools find data.csv
+        self.sessions = [session_cls(board, sespath, buffsize, fname="data" if not i else f"data_{i}",
+                                     label=f"board{i}", control=self.control,
+                                     stream_port=None if stream_port is None else stream_port + i,
+                                     ring_name=ring_name if not ring_name or not i else f"{ring_name}_{i}",
+                                     filters=filters)
+                         for i, board in enumerate(boardshims)]
+        self.lfpath = None
+        # The GUI plots the first board
+        self.board, self.data = self.sessions[0].board, self.sessions[0].data
+
+    def activate_logger(self, fpath):
+        # BrainFlow's logger is shared by all boards
+        self.sessions[0].activate_logger(fpath)
+        self.lfpath = fpath
+        for s in self.sessions:
+            s.lfpath = fpath
+
+    def log_message(self, level, message):
+        self.sessions[0].board.log_message(level, message)
+
+    def add_listener(self, callback):
+        """Call callback(state) when all boards have reached a state, or on the first error"""
+        self.listeners.append(callback)
+
+    def set_state(self, state):
+        self.state = state
+        for callback in self.listeners:
+            callback(state)
+
+    def abort(self):
+        for s in self.sessions:
+            s.abort()
+
+    def insert_marker(self, code):
+        """Write code into the marker channel of every board"""
+        return all([s.insert_marker(code) for s in self.sessions])
+
+    def run(self):
+        for s in self.sessions:
+            s.start()
+
+        # Sessions notify the shared control on every state change, so these waits wake without polling
+        self.control.wait_for(lambda: all(s.ready_flag.is_set() for s in self.sessions) or self.error_flag.is_set())
+        if self.error_flag.is_set():
+            self.join_sessions()
+            return
+        self.ready_flag.set()
+        self.set_state(READY)
+
+        self.control.wait_for(lambda: all(s.ongoing.is_set() for s in self.sessions) or self.error_flag.is_set()
+                              or self.stop_event.is_set())
+        if all(s.ongoing.is_set() for s in self.sessions):
+            self.ongoing.set()
+            self.set_state(STREAMING)
+            update_info(self.infopath, "Boards", {s.label: {"File": s.csvname,
+                                                            "BoardId": str(s.board.board_id),
+                                                            "StreamStart": f"{s.stream_start:.6f}"}
+                                                  for s in self.sessions})
+        self.join_sessions()
+
+    def join_sessions(self):
+        for s in self.sessions:
+            s.join()
+        self.ready_flag.clear()
+        self.ongoing.clear()
+        self.set_state(ERROR if self.error_flag.is_set() else STOPPED)
+
+    def get_stats(self):
+        """Combined figures: totals for rates and sizes, worst case for latencies and fill"""
+        snaps = [s.get_stats() for s in self.sessions]
+        combined = dict(snaps[0])
+        for key in ("samples", "samples_per_sec", "bytes_written", "queue_depth", "blocked_puts", "lost"):
+            combined[key] = sum(snap[key] for snap in snaps)
+        for key in ("drain_ms", "max_drain_ms", "write_ms", "max_write_ms", "buffer_fill"):
+            combined[key] = max(snap[key] for snap in snaps)
+        return combined
+
+    def get_error(self):
+        return next((s.get_error() for s in self.sessions if s.get_error()), "")
+
+    def get_flags(self):
+        return (self.ready_flag, self.ongoing, self.error_flag), (self.start_event, self.stop_event)
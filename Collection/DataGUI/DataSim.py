@@ -1,36 +1,173 @@
 import numpy as np
-from time import sleep
-from threading import Thread
+from brainflow.board_shim import BoardShim
+from scipy.signal import lfilter
+from time import perf_counter, sleep, time
+from threading import Thread, Lock
 
 
 # Simulated data generator for GUI testing
 class DataSim:
-    def __init__(self, rows):
-        self.buffer = np.zeros((rows, 1))
-        self.rows = rows
-        self.count = 1
+    """
+    Simulated board producing EEG-like data in a BrainFlow board's row layout
+
+    EEG rows carry 1/f (pink) noise, plus optional SSVEP sinusoids on every EEG channel and an ERP bump after every
+    marker. The package number row counts 0-255, the timestamp row holds wall-clock times, and the marker row holds
+    inserted markers at the sample they were inserted. Other rows are zero. Samples are generated in vectorized
+    blocks whose size is counted from a clock, so the simulated sample rate is exact however long each wait takes.
+    Like a board, the simulator keeps at most buffsize samples (see start_stream), dropping the oldest.
+
+    Parameters
+    ----------
+    board_id: int
+        BrainFlow board whose row layout and sampling rate are simulated
+    sample_rate: float
+        Samples per second; the board's sampling rate if None
+    seed: int
+        Seed of the noise generator, for repeatable data
+    ssvep: list
+        (frequency in Hz, amplitude in uV) of each SSVEP sinusoid
+    erp: tuple
+        (amplitude in uV, latency in s, width in s) of the bump added after each marker; no bumps if None
+    stress: bool
+        Run at stress_rate instead of sample_rate, for load tests of the GUI and storage path
+    """
+    noise_uv = 10.0  # RMS of the 1/f noise
+    stress_rate = 5000
+    max_tick = 0.01  # Longest sleep between generated blocks
+    speed = 1  # Samples are released at sample_rate * speed (see Replay.ReplaySource)
+    # IIR approximation of a 1/f spectrum (Julius O. Smith's pink noise filter, Spectral Audio Signal Processing)
+    pink_b = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+    pink_a = np.array([1, -2.494956002, 2.017265875, -0.522189400])
+    pink_gain = 1 / 0.086  # Makes the filter output unit variance for unit white noise
+
+    def __init__(self, board_id, sample_rate=None, seed=None, ssvep=None, erp=(8.0, 0.3, 0.05), stress=False):
+        self.rows = BoardShim.get_num_rows(board_id)
+        self.eeg_channels = BoardShim.get_eeg_channels(board_id)
+        self.package_channel = BoardShim.get_package_num_channel(board_id)
+        self.timestamp_channel = BoardShim.get_timestamp_channel(board_id)
+        self.marker_channel = BoardShim.get_marker_channel(board_id)
+        self.sample_rate = self.stress_rate if stress else sample_rate or BoardShim.get_sampling_rate(board_id)
+        self.ssvep = [(float(f), float(a)) for f, a in ssvep or []]
+        self.erp = erp
+        self.rng = np.random.default_rng(seed)
+        self.zi = np.zeros((len(self.eeg_channels), len(self.pink_a) - 1))  # Pink filter state per channel
+        self.blocks = []  # Generated (rows, n) blocks not yet read
+        self.buffered = 0
+        self.buffsize = None
+        self.generated = 0  # Absolute index of the next sample
+        self.markers = []  # (sample index, value) not yet written
+        self.onsets = []  # Sample indices of ERP bumps still in progress
+        self.start = None  # perf_counter() at the first sample
+        self.start_wall = time()  # time() at the first sample, reset when the stream starts
         self.active = False
-        self.logger = None
+        self.lock = Lock()
 
-    def start_stream(self):
+    def start_stream(self, buffsize=None):
+        """Start generating data, keeping at most buffsize samples (unlimited if None)"""
+        self.buffsize = buffsize
         self.active = True
-        gen = Thread(target=self.generate_data)
+        gen = Thread(target=self.generate_data, name="DataSimThread", daemon=True)
         gen.start()
 
     def stop_stream(self):
         self.active = False
 
     def generate_data(self):
+        self.start_wall = time()
+        self.start = perf_counter()
+        rate = self.sample_rate * self.speed
         while self.active:
-            sleep(.25)
-            new_col = np.ones((self.rows, 1)) * self.count
-            if not self.buffer.any():
-                self.buffer = new_col
+            sleep(min(1 / rate, self.max_tick))
+            n = int((perf_counter() - self.start) * rate) - self.generated
+            if n > 0:
+                self.push(self.generate(n))
+
+    def push(self, block):
+        """Buffer a generated block, dropping the oldest samples beyond buffsize"""
+        with self.lock:
+            self.blocks.append(block)
+            self.buffered += block.shape[1]
+            if self.buffsize and self.buffered > self.buffsize:
+                self.drop(self.buffered - self.buffsize)
+
+    def generate(self, n):
+        """Next n samples as a (rows, n) block"""
+        t = np.arange(self.generated, self.generated + n)
+        block = np.zeros((self.rows, n))
+        white = self.rng.standard_normal((len(self.eeg_channels), n))
+        pink, self.zi = lfilter(self.pink_b, self.pink_a, white, axis=1, zi=self.zi)
+        eeg = self.noise_uv * self.pink_gain * pink
+        if self.ssvep:
+            freqs, amps = np.array(self.ssvep).T
+            eeg += (amps[:, None] * np.sin(2 * np.pi * np.outer(freqs, t / self.sample_rate))).sum(axis=0)
+
+        for index, value in self.write_markers(block):
+            if self.erp:
+                self.onsets.append(max(index, self.generated))
+        if self.erp and self.onsets:
+            amp, latency, width = self.erp
+            onsets = np.array(self.onsets)
+            lag = (t[None, :] - onsets[:, None]) / self.sample_rate - latency
+            eeg += amp * np.exp(-0.5 * (lag / width) ** 2).sum(axis=0)
+            # Bumps are negligible 4 widths after their peak
+            self.onsets = [o for o in self.onsets if (t[-1] - o) / self.sample_rate < latency + 4 * width]
+
+        block[self.eeg_channels] = eeg
+        block[self.package_channel] = t % 256
+        block[self.timestamp_channel] = self.start_wall + t / self.sample_rate
+        self.generated += n
+        return block
+
+    def write_markers(self, block):
+        """Write inserted markers that fall in block (the next samples) to its marker row. Returns them."""
+        end = self.generated + block.shape[1]
+        with self.lock:
+            due = [(i, v) for i, v in self.markers if i < end]
+            self.markers = [(i, v) for i, v in self.markers if i >= end]
+        for index, value in due:
+            block[self.marker_channel, max(0, index - self.generated)] = value
+        return due
+
+    def drop(self, count):
+        """Discard the oldest count buffered samples, as a board's ring buffer overwrites them"""
+        while count:
+            first = self.blocks[0]
+            if first.shape[1] <= count:
+                self.blocks.pop(0)
+                self.buffered -= first.shape[1]
+                count -= first.shape[1]
             else:
-                self.buffer = np.hstack((self.buffer, new_col))
-            self.count += 1
+                self.blocks[0] = first[:, count:]
+                self.buffered -= count
+                count = 0
+
+    def insert_marker(self, value):
+        """Write value into the marker channel at the current sample"""
+        with self.lock:
+            index = self.generated
+            if self.active and self.start is not None:
+                index = max(index, int((perf_counter() - self.start) * self.sample_rate * self.speed))
+            self.markers.append((index, value))
+
+    def get_data_count(self):
+        with self.lock:
+            return self.buffered
 
-    def get_data(self):
-        copy = np.copy(self.buffer)
-        self.buffer = np.zeros((5, 1))
-        return copy
+    def get_data(self, num_samples=None):
+        """Remove and return the oldest num_samples columns (all columns by default)"""
+        with self.lock:
+            if num_samples is None:
+                num_samples = self.buffered
+            num_samples = min(num_samples, self.buffered)
+            out, taken = [], 0
+            while taken < num_samples:
+                first = self.blocks[0]
+                take = min(first.shape[1], num_samples - taken)
+                out.append(first[:, :take])
+                if take == first.shape[1]:
+                    self.blocks.pop(0)
+                else:
+                    self.blocks[0] = first[:, take:]
+                taken += take
+            self.buffered -= taken
+        return np.hstack(out) if out else np.empty((self.rows, 0))
@@ -0,0 +1,74 @@
+"""Online filtering of drained board data"""
+import numpy as np
+
+from scipy.signal import butter, iirnotch, sosfilt, sosfilt_zi, tf2sos
+
+
+class StreamFilter:
+    """
+    Causal notch and bandpass filter applied chunk by chunk, with optional common average reference (CAR)
+
+    Filter state is carried between chunks, so filtering a session chunk by chunk gives the same result as filtering
+    it in one piece with sosfilt. Cutoffs at or above the Nyquist frequency are lowered (bandpass) or dropped
+    (notch) so the filter can be built for any sampling rate.
+
+    Parameters
+    ----------
+    channels: list
+        Rows to filter (e.g. BoardShim.get_eeg_channels); other rows are passed through
+    sample_rate: float
+        Sampling rate of the board in Hz
+    notch: float
+        Mains frequency to remove in Hz; no notch if None
+    band: tuple
+        (low, high) bandpass cutoffs in Hz; no bandpass if None
+    order: int
+        Butterworth order of the bandpass
+    car: bool
+        Subtract the mean of the filtered channels from each of them
+    """
+    notch_q = 30
+
+    def __init__(self, channels, sample_rate, notch=60.0, band=(1.0, 50.0), order=4, car=False):
+        self.channels = list(channels)
+        self.sample_rate = sample_rate
+        self.car = car
+        nyquist = sample_rate / 2
+        sections = []
+        self.notch = notch if notch and notch < nyquist else None
+        if self.notch:
+            sections.append(tf2sos(*iirnotch(self.notch, self.notch_q, fs=sample_rate)))
+        self.band = None
+        if band:
+            low, high = band[0], min(band[1], 0.9 * nyquist)
+            if 0 < low < high:
+                self.band = (low, high)
+                sections.append(butter(order, self.band, btype='bandpass', fs=sample_rate, output='sos'))
+        self.order = order
+        self.sos = np.vstack(sections) if sections else None
+        self.zi = None
+
+    def apply(self, chunk):
+        """Filtered copy of (rows, n) chunk"""
+        out = np.array(chunk, dtype=np.float64)
+        if not chunk.shape[1] or not self.channels:
+            return out
+        x = out[self.channels]
+        if self.sos is not None:
+            if self.zi is None:  # Start from steady state at the first sample to avoid a large onset transient
+                self.zi = sosfilt_zi(self.sos)[:, None, :] * x[None, :, :1]
+            x, self.zi = sosfilt(self.sos, x, axis=-1, zi=self.zi)
+        if self.car:
+            x -= x.mean(axis=0)
+        out[self.channels] = x
+        return out
+
+    def settings(self):
+        """Filter settings for info.json (values are strings per info.json conventions)"""
+        return {
+            "Notch": f"{self.notch:g}" if self.notch else "None",
+            "Bandpass": f"{self.band[0]:g}-{self.band[1]:g}" if self.band else "None",
+            "Order": str(self.order),
+            "CAR": str(self.car),
+            "Channels": ",".join(str(c) for c in self.channels)
+        }
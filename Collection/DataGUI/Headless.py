@@ -0,0 +1,298 @@
+"""Collection without the GUI, for unattended recordings and machines without a display"""
+import argparse
+import json
+import os
+import signal
+import sys
+
+import BoardBridge
+import BoardlessBridge
+
+from Acquisition import MarkerCodes
+from brainflow import BrainFlowInputParams, BrainFlowError
+from brainflow.board_shim import BoardShim
+from datetime import datetime
+from SessionIO import create_empty_info
+from threading import Lock
+from time import perf_counter
+
+boardmap = {'Cyton': 0, 'CytonDaisy': 2, 'Synthetic': -1}
+buffsize_max = 450000
+buffsize_min = 3000
+log_lock = Lock()  # Records come from the main thread and the session thread (state changes)
+
+
+def log(event, **fields):
+    """Print one structured log record (a JSON object per line) to stdout"""
+    record = json.dumps({"time": datetime.now().isoformat(timespec='milliseconds'), "event": event, **fields})
+    with log_lock:
+        print(record, flush=True)
+
+
+def build_info(args):
+    """info.json contents from --info and the command line parameters (the command line takes precedence)"""
+    if args.info:
+        with open(args.info) as i:
+            info = json.load(i)
+        info.setdefault('Annotations', [])
+    else:
+        info = create_empty_info()
+    sparams, hparams = info['SessionParams'], info['HardwareParams']
+    for key, value in (('SubjectName', args.subject), ('ProjectName', args.project),
+                       ('ResponseType', args.response_type), ('StimulusType', args.stimulus_type),
+                       ('BlockLength', args.block_length), ('BlockCount', args.block_count),
+                       ('StimCycle', args.stim_cycle)):
+        if value is not None:
+            sparams[key] = str(value)
+    for key, value in (('HeadsetConfiguration', args.config), ('HeadsetModel', args.model),
+                       ('BufferSize', args.buffsize)):
+        if value is not None:
+            hparams[key] = str(value)
+    if args.description is not None:
+        info['Description'] = args.description
+    # Defaults of the GUI's choices for fields that are still empty
+    for params, key, default in ((sparams, 'ResponseType', 'SSVEP'), (sparams, 'StimulusType', 'visual'),
+                                 (hparams, 'HeadsetConfiguration', 'Standard'), (hparams, 'HeadsetModel', 'CytonDaisy'),
+                                 (hparams, 'BufferSize', '100000')):
+        if not params.get(key):
+            params[key] = default
+    model = hparams['HeadsetModel']
+    if model in boardmap:
+        hparams['SampleRate'] = str(BoardShim.get_sampling_rate(boardmap[model]))
+    info['Date'] = datetime.now().strftime("%m-%d-%y")
+    info['Time'] = datetime.now().strftime("%H:%M")
+    return info
+
+
+def check_info(info, ports):
+    """Same checks as InfoWindow.check_info. Returns an error message, or an empty string if info is valid."""
+    sparams, hparams = info['SessionParams'], info['HardwareParams']
+    if not sparams.get('SubjectName', "").strip():
+        return "No subject name supplied."
+    if not sparams.get('ProjectName', "").strip():
+        return "No project name supplied."
+    try:
+        bl, bc = int(sparams.get('BlockLength')), int(sparams.get('BlockCount'))
+    except (TypeError, ValueError):
+        return "Block length and block count must be integers."
+    if bl < 1 or bc < 1:
+        return "Block length and block count must be positive."
+    stimcycle = sparams.get('StimCycle', "").strip()
+    if stimcycle.replace("1", "").replace("0", ""):
+        return "Invalid characters in stim cycle."
+    if len(stimcycle) != bc:
+        return "Stim cycle does not match block count."
+    if hparams['HeadsetModel'] not in boardmap:
+        return f"Unknown headset model. (Options: {', '.join(boardmap)})"
+    try:
+        buffsize = int(hparams.get('BufferSize'))
+    except (TypeError, ValueError):
+        return "Buffer size must be an integer."
+    if not buffsize_min <= buffsize <= buffsize_max:
+        return f"Buffer size must be between {buffsize_min} and {buffsize_max}."
+    if not ports and hparams['HeadsetModel'] != 'Synthetic':
+        return "No serial port supplied."
+    if len(set(ports)) != len(ports):
+        return "Serial port listed more than once."
+    return ""
+
+
+def create_session_dir(root, info):
+    """Create a new session folder in root, as the GUI does, and write info.json with block annotations"""
+    bl, bc = int(info['SessionParams']['BlockLength']), int(info['SessionParams']['BlockCount'])
+    info['Annotations'] += [(float(bl * k), f"Block{k}") for k in range(1, bc + 1)]
+    suffix = info['Date'] + "_" + str(datetime.now().timestamp()).split(".")[1]
+    sespath = os.path.join(root, f"session_{suffix}")
+    os.makedirs(sespath, exist_ok=True, mode=0o777)
+    with open(os.path.join(sespath, "info.json"), 'w') as f:
+        json.dump(info, f, ensure_ascii=False, indent=4)
+    return sespath
+
+
+class HeadlessRun:
+    """
+    Drives a CollectionSession (or MultiBoardSession) through preparation, the session's blocks, and stop
+
+    The first SIGINT/SIGTERM stops the stream the same way the GUI's stop button does, so the remaining samples
+    are drained and all files are closed. A second one aborts the session. A stop before the stream has started
+    (e.g. during a hung board preparation) ends the run cleanly rather than as an error.
+
+    Parameters
+    ----------
+    session: CollectionSession | MultiBoardSession
+        Session to run (not yet started)
+    infopath: str
+        Path to the session's info.json
+    progress_interval: float
+        Seconds between progress records
+    """
+    wait_slice = 0.5  # Longest single wait of the main thread; on Windows signal handlers only run between waits
+
+    def __init__(self, session, infopath, progress_interval=10.0):
+        self.session = session
+        self.control = session.control
+        self.markers = MarkerCodes(infopath)
+        with open(infopath) as i:
+            sparams = json.load(i)['SessionParams']
+        self.blength, self.bcount = int(sparams['BlockLength']), int(sparams['BlockCount'])
+        self.stimcycle = sparams['StimCycle']
+        self.progress_interval = progress_interval
+        self.signals = 0
+        self.stop_requested = False  # Stopped by a signal before any error
+        session.add_listener(lambda state: log("state", state=state, error=session.get_error() or None))
+
+    def on_signal(self, signum, frame):
+        self.signals += 1
+        log("signal", signal=signal.Signals(signum).name, action="stop" if self.signals == 1 else "abort")
+        if self.signals == 1:
+            self.stop_requested = not self.session.error_flag.is_set()
+            self.session.stop_event.set()
+        else:
+            self.session.abort()
+
+    def mark(self, label):
+        code = self.markers.code(label)
+        if self.session.insert_marker(code):
+            log("marker", code=code, label=label)
+
+    def on_start(self):
+        """Called once the stream has been started"""
+        self.mark("BlockStart")  # Held by the session until the stream is running
+
+    def wait(self, *events, timeout=None):
+        """SessionControl.wait in slices of at most wait_slice, so signals are handled while waiting"""
+        end = None if timeout is None else perf_counter() + timeout
+        while True:
+            left = self.wait_slice if end is None else min(self.wait_slice, max(0.0, end - perf_counter()))
+            if self.control.wait(*events, timeout=left):
+                return True
+            if end is not None and perf_counter() >= end:
+                return False
+
+    def run(self):
+        """Returns True if the session ran to its end or was stopped, False on error"""
+        session = self.session
+        session.start()
+        try:
+            self.wait(session.ready_flag, session.error_flag, session.stop_event)
+            if session.ready_flag.is_set() and not session.stop_event.is_set():
+                session.start_event.set()
+                self.on_start()
+                self.wait(session.ongoing, session.error_flag, session.stop_event)
+            if session.ongoing.is_set():
+                self.collect()
+            elif not session.start_event.is_set():  # Stopped before starting; the session still waits for a start
+                session.abort()
+        except BaseException:  # Do not leave the session thread running
+            session.abort()
+            raise
+        finally:
+            while session.is_alive():
+                session.join(self.wait_slice)
+            self.markers.compact()
+        if self.stop_requested and not session.start_event.is_set():
+            log("stopped", message="Stopped before the stream started.")
+            return True
+        return not session.error_flag.is_set()
+
+    def collect(self):
+        """Mark block starts and log progress until the last block ends or the session is stopped"""
+        start = perf_counter()
+        block = 1
+        log("block", block=block, active=self.stimcycle[0] == '1')
+        next_progress = self.progress_interval
+        end = self.blength * self.bcount
+        while True:
+            elapsed = perf_counter() - start
+            due = min(block * self.blength, next_progress, end)
+            if self.wait(self.session.stop_event, self.session.error_flag, timeout=max(0.0, due - elapsed)):
+                return
+            elapsed = perf_counter() - start
+            if elapsed >= end:
+                log("complete", elapsed=round(elapsed, 3))
+                self.session.stop_event.set()
+                return
+            if elapsed >= block * self.blength:
+                block += 1
+                self.mark("BlockStart")
+                log("block", block=block, active=self.stimcycle[block - 1] == '1')
+            if elapsed >= next_progress:
+                next_progress += self.progress_interval
+                log("progress", elapsed=round(elapsed, 3), block=block, stats=self.session.get_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Headless.py',
+                                     description='Runs a collection session without the GUI. Progress is printed as '
+                                                 'one JSON object per line.')
+    parser.add_argument('--info', help="info.json to take session parameters from (other options override it)")
+    parser.add_argument('--dir', default=os.getcwd(), help="Directory to create the session folder in")
+    parser.add_argument('--subject', help="Subject name")
+    parser.add_argument('--project', help="Project name")
+    parser.add_argument('--response-type', help="Response type (SSVEP, ERP, other)")
+    parser.add_argument('--stimulus-type', help="Stimulus type (visual, audio, other)")
+    parser.add_argument('--block-length', type=int, help="Block length in seconds")
+    parser.add_argument('--block-count', type=int, help="Number of blocks")
+    parser.add_argument('--stim-cycle', help="Active (1) and inactive (0) blocks, e.g. 10101")
+    parser.add_argument('--description', help="Session description")
+    parser.add_argument('--model', choices=list(boardmap), help="Headset model (default CytonDaisy)")
+    parser.add_argument('--config', help="Headset configuration (Standard, Occipital, Other)")
+    parser.add_argument('--serial-port', default="", help="Board serial port(s), comma separated")
+    parser.add_argument('--buffsize', type=int, help="On-board buffer size in samples (default 100000)")
+    parser.add_argument('--filter', choices=["none", "bandpass", "car"], default="none",
+                        help="Online filter: notch + bandpass, optionally with common average reference")
+    parser.add_argument('--mains', type=float, default=60, help="Notch frequency of the online filter in Hz")
+    parser.add_argument('--stream-port', type=int, default=-1, help="Live stream port, e.g. 47800 (-1 for none)")
+    parser.add_argument('--ring-name', default="", help="Shared memory ring name, e.g. NeuroData (empty for none)")
+    parser.add_argument('--progress', type=float, default=10.0, help="Seconds between progress records")
+    parser.add_argument('--boardless', action='store_true', help="Simulate data instead of reading the board")
+    args = parser.parse_args()
+
+    ports = [p.strip() for p in args.serial_port.split(",") if p.strip()]
+    info = build_info(args)
+    if err := check_info(info, ports):
+        log("error", message=err)
+        return 2
+
+    sespath = create_session_dir(args.dir, info)
+    infopath = os.path.join(sespath, "info.json")
+    log("session", path=sespath, model=info['HardwareParams']['HeadsetModel'], ports=ports)
+
+    bid = boardmap[info['HardwareParams']['HeadsetModel']]
+    boards = []
+    for port in ports or [""]:
+        params = BrainFlowInputParams()
+        params.serial_port = port
+        try:
+            boards.append(BoardShim(bid, params))
+        except BrainFlowError as E:
+            log("error", message=f"Error creating BoardShim object. {E}")
+            return 1
+
+    bridge = BoardlessBridge if args.boardless else BoardBridge
+    buffsize = int(info['HardwareParams']['BufferSize'])
+    filters = None if args.filter == "none" else {'notch': args.mains, 'band': (1.0, 50.0),
+                                                   'car': args.filter == "car"}
+    stream_port = None if args.stream_port < 0 else args.stream_port
+    ring_name = args.ring_name or None
+    if len(boards) == 1:
+        session = bridge.CollectionSession(boards[0], sespath, buffsize, stream_port=stream_port,
+                                           ring_name=ring_name, filters=filters)
+    else:
+        session = BoardBridge.MultiBoardSession(boards, sespath, buffsize, bridge.CollectionSession,
+                                                stream_port=stream_port, ring_name=ring_name, filters=filters)
+    session.activate_logger(os.path.join(sespath, "sessionlog.log"))
+
+    runner = HeadlessRun(session, infopath, args.progress)
+    signal.signal(signal.SIGINT, runner.on_signal)
+    signal.signal(signal.SIGTERM, runner.on_signal)
+    ok = runner.run()
+    for board in boards:
+        if board.is_prepared():
+            board.release_session()
+    log("exit", ok=ok, error=None if ok else session.get_error() or None)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
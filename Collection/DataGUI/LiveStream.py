@@ -0,0 +1,219 @@
+"""Local stream of drained board data for live consumers (online analysis, plotting)"""
+import argparse
+import json
+import socket
+import struct
+
+import numpy as np
+
+from brainflow.board_shim import BoardShim
+from queue import Queue, Full
+from threading import Thread, Lock
+
+HEADER_MAGIC = b"NDHD"
+CHUNK_MAGIC = b"NDCH"
+HEADER_FRAME = struct.Struct("<4sI")  # magic, length of the JSON metadata that follows
+CHUNK_FRAME = struct.Struct("<4sII")  # magic, rows, samples; followed by float64 samples, sample-major
+
+
+def chunk_frame(chunk):
+    """Encode (rows, n) chunk as a stream frame"""
+    rows, n = chunk.shape
+    return CHUNK_FRAME.pack(CHUNK_MAGIC, rows, n) + np.ascontiguousarray(chunk.T, dtype="<f8").tobytes()
+
+
+class ClientSender(Thread):
+    """
+    Sends queued frames to one connected client
+
+    Each client has its own bounded queue so a slow reader cannot hold up the collection thread or other clients.
+    A client whose queue fills up is disconnected rather than silently skipping chunks.
+    """
+    def __init__(self, conn, addr, maxsize):
+        super().__init__(name=f"StreamSender-{addr[1]}", daemon=True)
+        self.conn = conn
+        self.addr = addr
+        self.queue = Queue(maxsize)
+        self.closed = False
+        self.behind = False
+
+    def send(self, frame):
+        """Queue frame for sending. Returns False if the client is closed or too far behind."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except Full:
+            self.behind = True
+            self.close()
+            return False
+        return True
+
+    def run(self):
+        try:
+            while (frame := self.queue.get()) is not None:
+                self.conn.sendall(frame)
+        except OSError:
+            pass
+        self.closed = True
+        self.conn.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except Full:  # Sender is stuck on a full socket; closing it ends sendall
+            self.conn.close()
+
+
+class StreamServer(Thread):
+    """
+    TCP server on the local machine that publishes board data to any number of clients
+
+    A client receives a header frame with the stream metadata as JSON on connecting, then one frame per published
+    chunk. Chunks published before a client connects are not sent to it.
+
+    Parameters
+    ----------
+    metadata: dict
+        Stream description sent to clients (board id, sampling rate, channel rows; see stream_metadata)
+    port: int
+        TCP port to listen on. 0 picks a free port (see self.port).
+    host: str
+        Address to listen on. Loopback by default so the stream is not exposed to the network.
+    maxsize: int
+        Maximum number of frames queued per client
+    """
+    def __init__(self, metadata, port=0, host="127.0.0.1", maxsize=256):
+        super().__init__(name="StreamServer", daemon=True)
+        self.maxsize = maxsize
+        self.header = json.dumps(metadata).encode()
+        self.lock = Lock()
+        self.clients = []
+        self.dropped = 0  # Clients disconnected for falling behind
+        self.closed = False
+        self.sock = socket.create_server((host, port))
+        self.host, self.port = self.sock.getsockname()[:2]
+
+    def run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:  # Socket closed
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = ClientSender(conn, addr, self.maxsize)
+            client.send(HEADER_FRAME.pack(HEADER_MAGIC, len(self.header)) + self.header)
+            with self.lock:
+                if self.closed:
+                    client.close()
+                    conn.close()
+                    break
+                self.clients.append(client)
+            client.start()
+
+    def publish(self, chunk):
+        """Send (rows, n) chunk to all connected clients"""
+        with self.lock:
+            if not self.clients:
+                return
+            frame = chunk_frame(chunk)
+            for client in self.clients:
+                client.send(frame)
+            self.dropped += sum(1 for c in self.clients if c.behind)
+            self.clients = [c for c in self.clients if not c.closed]
+
+    def client_count(self):
+        with self.lock:
+            return len(self.clients)
+
+    def close(self):
+        """Stop accepting clients and disconnect the current ones after their queued frames are sent"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            clients, self.clients = self.clients, []
+        self.sock.close()
+        for client in clients:
+            client.close()
+
+
+def stream_metadata(board_id, sample_rate=None, label=None):
+    """Stream description for a BrainFlow board: its BoardShim.get_board_descr plus board id and label"""
+    meta = dict(BoardShim.get_board_descr(board_id))
+    meta["board_id"] = board_id
+    if sample_rate is not None:
+        meta["sampling_rate"] = sample_rate
+    meta["label"] = label
+    return meta
+
+
+class StreamClient:
+    """
+    Reads board data published by a StreamServer
+
+    Iterating yields (rows, n) arrays in the layout of BoardShim.get_board_data() until the stream ends.
+
+    Parameters
+    ----------
+    port: int
+        Port of the server
+    host: str
+        Address of the server
+    timeout: float
+        Seconds to wait for data before raising socket.timeout (None waits forever)
+    """
+    def __init__(self, port, host="127.0.0.1", timeout=None):
+        self.sock = socket.create_connection((host, port))
+        self.sock.settimeout(timeout)
+        self.file = self.sock.makefile('rb')
+        magic, length = HEADER_FRAME.unpack(self.read_exact(HEADER_FRAME.size))
+        if magic != HEADER_MAGIC:
+            raise ValueError("Not a NeuroData stream.")
+        self.metadata = json.loads(self.read_exact(length))
+
+    def read_exact(self, n):
+        data = self.file.read(n)
+        if len(data) < n:
+            raise EOFError("Stream closed.")
+        return data
+
+    def read(self):
+        """Next chunk, or None once the stream has ended"""
+        try:
+            magic, rows, n = CHUNK_FRAME.unpack(self.read_exact(CHUNK_FRAME.size))
+            if magic != CHUNK_MAGIC:
+                raise ValueError("Corrupt stream frame.")
+            data = self.read_exact(8 * rows * n)
+        except EOFError:
+            return None
+        return np.frombuffer(data, dtype="<f8").reshape(n, rows).T
+
+    def __iter__(self):
+        while (chunk := self.read()) is not None:
+            yield chunk
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='LiveStream.py',
+                                     description='Prints the chunks received from a running collection session')
+    parser.add_argument('port', type=int, help="Port of the session's stream (see sessionlog.log)")
+    parser.add_argument('--host', default="127.0.0.1", help="Address of the collection machine")
+    args = parser.parse_args()
+    with StreamClient(args.port, args.host) as client:
+        print(json.dumps(client.metadata))
+        for chunk in client:
+            print(f"{chunk.shape[1]} samples, last timestamp {chunk[client.metadata['timestamp_channel'], -1]:.3f}")
@@ -0,0 +1,280 @@
+"""Replay of recorded sessions through CollectionSession, for testing online pipelines and GUI changes offline"""
+import argparse
+import json
+import os
+import signal
+import sys
+
+import numpy as np
+
+import BoardlessBridge
+
+from brainflow import BrainFlowInputParams
+from brainflow.board_shim import BoardShim
+from DataSim import DataSim
+from datetime import datetime
+from Headless import HeadlessRun, boardmap, buffsize_max, buffsize_min, log
+from SessionIO import AnnotationJournal, load_binary
+from time import perf_counter, sleep, time
+
+
+def load_session(path, fname="data"):
+    """
+    Recorded data of a session folder, as written by the GUI or downloaded by retrieve.py
+
+    <fname>.bin is read if present, <fname>.csv otherwise. The board of csv data is taken from the HeadsetModel
+    in info.json.
+
+    Returns
+    -------
+    data: np.ndarray
+        (rows, samples) board data
+    info: dict
+        Contents of info.json
+    board_id: int
+        Board whose row layout the data has
+    sample_rate: float
+        Recorded samples per second
+    """
+    with open(os.path.join(path, "info.json")) as i:
+        info = json.load(i)
+    binpath = os.path.join(path, fname + ".bin")
+    if os.path.exists(binpath):
+        data, header = load_binary(binpath)
+        return data, info, header['board_id'], float(header['sample_rate'])
+
+    hparams = info.get('HardwareParams', {})
+    model = hparams.get('HeadsetModel')
+    if model not in boardmap:
+        raise ValueError(f"Unknown headset model '{model}' in info.json. (Options: {', '.join(boardmap)})")
+    bid = boardmap[model]
+    data = np.loadtxt(os.path.join(path, fname + ".csv"), ndmin=2)
+    if data.shape[0] != BoardShim.get_num_rows(bid):
+        raise ValueError(f"{fname}.csv has {data.shape[0]} rows, {model} data has {BoardShim.get_num_rows(bid)}.")
+    return data, info, bid, float(hparams.get('SampleRate') or BoardShim.get_sampling_rate(bid))
+
+
+class ReplaySource(DataSim):
+    """
+    Board-like source that plays recorded data back, in place of DataSim
+
+    Samples are released at sample_rate * speed, counted from a clock as in DataSim, and buffered the same way.
+    Recorded rows are passed through unchanged, except that timestamps are shifted to start when the replay starts
+    (keeping their recorded spacing) and markers inserted during the replay are written to the marker row.
+    Annotations are passed to on_annotation once the replay reaches their time; those after the last sample follow
+    it. on_end is called after the last sample.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        (rows, samples) recorded board data
+    board_id: int
+        Board whose row layout the data has
+    sample_rate: float
+        Recorded samples per second
+    speed: float
+        Playback speed (1 for real time)
+    annotations: list
+        (time in seconds since session start, note) of each annotation
+    """
+    def __init__(self, data, board_id, sample_rate, speed=1.0, annotations=()):
+        super().__init__(board_id, sample_rate, erp=None)
+        self.data = data
+        self.total = data.shape[1]
+        self.board_id = board_id
+        self.speed = speed
+        self.has_markers = bool(np.any(data[self.marker_channel]))
+        self.annotations = sorted((float(t), note) for t, note in annotations)
+        self.offset = 0.0  # Added to recorded timestamps
+        self.on_annotation = None  # Called with (time, note)
+        self.on_end = None
+
+    @classmethod
+    def from_session(cls, path, speed=1.0, fname="data"):
+        """Source replaying the session folder at path (see load_session)"""
+        data, info, bid, srate = load_session(path, fname)
+        return cls(data, bid, srate, speed, info.get('Annotations', []))
+
+    @property
+    def position(self):
+        """Seconds of recorded data released so far"""
+        return self.generated / self.sample_rate
+
+    def generate_data(self):
+        self.start_wall = time()
+        self.start = perf_counter()
+        if self.total:
+            self.offset = self.start_wall - self.data[self.timestamp_channel, 0]
+        rate = self.sample_rate * self.speed
+        while self.active and self.generated < self.total:
+            sleep(min(1 / rate, self.max_tick))
+            n = min(int((perf_counter() - self.start) * rate), self.total) - self.generated
+            if n > 0:
+                self.push(self.generate(n))
+                self.emit_annotations(self.position)
+        if self.generated == self.total:
+            self.emit_annotations(float('inf'))
+            if self.on_end:
+                self.on_end()
+
+    def generate(self, n):
+        """Next n recorded samples as a (rows, n) block"""
+        block = np.array(self.data[:, self.generated:self.generated + n], dtype=np.float64)
+        self.write_markers(block)
+        block[self.timestamp_channel] += self.offset
+        self.generated += n
+        return block
+
+    def emit_annotations(self, until):
+        while self.annotations and self.annotations[0][0] <= until:
+            time_, note = self.annotations.pop(0)
+            if self.on_annotation:
+                self.on_annotation(time_, note)
+
+
+class ReplaySession(BoardlessBridge.CollectionSession):
+    """
+    CollectionSession reading a ReplaySource instead of a board. Draining, storage, filtering, the live stream,
+    and the shared ring run as they do for a recording.
+
+    Parameters
+    ----------
+    source: ReplaySource
+        Recorded data to stream
+    sespath: str
+        Path to the output session folder, containing its info.json
+    buffsize: int
+        Buffer size of the source in samples
+    kwargs:
+        Passed to CollectionSession (fname, stream_port, ring_name, filters, ...)
+    """
+    sim_prep_time = 0
+
+    def __init__(self, source, sespath, buffsize, **kwargs):
+        self.source = source
+        super().__init__(BoardShim(source.board_id, BrainFlowInputParams()), sespath, buffsize, **kwargs)
+
+    def create_sim(self, bid):
+        return self.source
+
+
+class ReplayRun(HeadlessRun):
+    """
+    HeadlessRun that stops when the replayed data ends and re-emits the recording's annotations
+
+    Annotations are logged and journaled to the output session as the replay reaches them. Recordings without
+    markers (older sessions) also get one marker per annotation, so online pipelines see the events in the data.
+
+    Parameters
+    ----------
+    session: ReplaySession
+        Session to run (not yet started)
+    infopath: str
+        Path to the output session's info.json
+    progress_interval: float
+        Seconds between progress records
+    """
+    def __init__(self, session, infopath, progress_interval=10.0):
+        super().__init__(session, infopath, progress_interval)
+        self.source = session.source
+        self.journal = AnnotationJournal(infopath)
+        self.source.on_annotation = self.annotate
+        self.source.on_end = self.on_end
+
+    def on_start(self):
+        pass  # The recording carries its own block markers
+
+    def annotate(self, time_, note):
+        self.journal.add(time_, note)
+        code = None
+        if not self.source.has_markers:
+            code = self.markers.code(note)
+            self.session.insert_marker(code)
+        log("annotation", at=time_, note=note, code=code)
+
+    def on_end(self):
+        log("complete", replayed=round(self.source.position, 3))
+        self.session.stop_event.set()
+
+    def run(self):
+        try:
+            return super().run()
+        finally:
+            self.journal.compact()
+
+    def collect(self):
+        """Log progress until the replayed data ends or the session is stopped"""
+        start = perf_counter()
+        next_progress = self.progress_interval
+        while not self.wait(self.session.stop_event, self.session.error_flag,
+                            timeout=max(0.0, next_progress - (perf_counter() - start))):
+            next_progress += self.progress_interval
+            log("progress", elapsed=round(perf_counter() - start, 3), replayed=round(self.source.position, 3),
+                stats=self.session.get_stats())
+
+
+def create_replay_dir(root, srcpath, info, speed):
+    """Create the output session folder of a replay, with the recording's info.json minus its annotations"""
+    info = dict(info, Annotations=[], Replay={"Source": os.path.abspath(srcpath), "Speed": str(speed)})
+    info['Date'] = datetime.now().strftime("%m-%d-%y")
+    info['Time'] = datetime.now().strftime("%H:%M")
+    suffix = info['Date'] + "_" + str(datetime.now().timestamp()).split(".")[1]
+    sespath = os.path.join(root, f"replay_{suffix}")
+    os.makedirs(sespath, exist_ok=True, mode=0o777)
+    with open(os.path.join(sespath, "info.json"), 'w') as f:
+        json.dump(info, f, ensure_ascii=False, indent=4)
+    return sespath
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Replay.py',
+                                     description='Streams a recorded session through a collection session, at real '
+                                                 'time or faster, re-emitting its annotations. Progress is printed '
+                                                 'as one JSON object per line.')
+    parser.add_argument('session', help="Recorded session folder (info.json with data.bin or data.csv)")
+    parser.add_argument('--fname', default="data", help="Name of the data file without extension")
+    parser.add_argument('--speed', type=float, default=1.0, help="Playback speed (1 for real time)")
+    parser.add_argument('--dir', default=os.getcwd(), help="Directory to create the output session folder in")
+    parser.add_argument('--buffsize', type=int, default=100000, help="Buffer size of the source in samples")
+    parser.add_argument('--filter', choices=["none", "bandpass", "car"], default="none",
+                        help="Online filter: notch + bandpass, optionally with common average reference")
+    parser.add_argument('--mains', type=float, default=60, help="Notch frequency of the online filter in Hz")
+    parser.add_argument('--stream-port', type=int, default=47800, help="Live stream port (-1 for none)")
+    parser.add_argument('--ring-name', default="NeuroData", help="Shared memory ring name (empty for none)")
+    parser.add_argument('--progress', type=float, default=10.0, help="Seconds between progress records")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        log("error", message="Speed must be positive.")
+        return 2
+    if not buffsize_min <= args.buffsize <= buffsize_max:
+        log("error", message=f"Buffer size must be between {buffsize_min} and {buffsize_max}.")
+        return 2
+    try:
+        data, info, bid, srate = load_session(args.session, args.fname)
+    except (OSError, ValueError) as E:
+        log("error", message=f"Could not load session. {E}")
+        return 1
+    source = ReplaySource(data, bid, srate, args.speed, info.get('Annotations', []))
+
+    sespath = create_replay_dir(args.dir, args.session, info, args.speed)
+    infopath = os.path.join(sespath, "info.json")
+    log("session", path=sespath, source=os.path.abspath(args.session), board_id=bid, sample_rate=srate,
+        samples=source.total, speed=args.speed)
+
+    filters = None if args.filter == "none" else {'notch': args.mains, 'band': (1.0, 50.0),
+                                                   'car': args.filter == "car"}
+    session = ReplaySession(source, sespath, args.buffsize, stream_port=None if args.stream_port < 0 else
+                            args.stream_port, ring_name=args.ring_name or None, filters=filters)
+    session.activate_logger(os.path.join(sespath, "sessionlog.log"))
+
+    runner = ReplayRun(session, infopath, args.progress)
+    signal.signal(signal.SIGINT, runner.on_signal)
+    signal.signal(signal.SIGTERM, runner.on_signal)
+    ok = runner.run()
+    log("exit", ok=ok, error=None if ok else session.get_error() or None)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
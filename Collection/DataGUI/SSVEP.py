@@ -0,0 +1,190 @@
+"""Online SSVEP detection for GridFlash sessions"""
+import argparse
+import json
+
+import numpy as np
+
+from LiveStream import StreamClient
+
+OCCIPITAL = ("O1", "O2", "Oz", "PO3", "PO4", "POz", "PO7", "PO8")
+
+
+def occipital_channels(metadata):
+    """Rows of the occipital EEG channels in a stream's metadata, or all EEG rows if none are named"""
+    rows = metadata["eeg_channels"]
+    names = metadata.get("eeg_names", "").split(",")
+    picks = [r for r, name in zip(rows, names) if name.strip() in OCCIPITAL]
+    return picks or rows
+
+
+class SSVEPDetector:
+    """
+    Scores SSVEP frequencies over a sliding window with canonical correlation analysis (CCA) and harmonic power
+
+    The detector keeps running sums of the window's channel and reference products (means, auto- and
+    cross-covariances). New samples are added to the sums and samples leaving the window are subtracted, so an
+    update costs time proportional to the new samples, not the window length. Sine/cosine references are tied to
+    absolute sample indices and built from a table computed once, rotated to each chunk's start phase.
+
+    Scoring only works on the sums: CCA's largest canonical correlation comes from the whitened cross-covariance,
+    and the share of channel variance explained by each frequency's harmonics (its DFT power) comes from the same
+    cross-covariance.
+
+    Parameters
+    ----------
+    frequencies: list
+        Stimulus frequencies in Hz
+    channels: list
+        Rows of the board data to use (see occipital_channels)
+    sample_rate: float
+        Sampling rate of the board in Hz
+    window: float
+        Window length in seconds
+    harmonics: int
+        Number of harmonics of each frequency in the references
+    reg: float
+        Ridge added to the channel covariance, relative to its mean variance
+    """
+    def __init__(self, frequencies, channels, sample_rate, window=2.0, harmonics=2, reg=1e-6):
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.channels = list(channels)
+        self.sample_rate = sample_rate
+        self.n = int(window * sample_rate)
+        self.harmonics = harmonics
+        self.reg = reg
+        nf, nc, nr = len(self.frequencies), len(self.channels), 2 * harmonics
+
+        # Radians per sample of each (frequency, harmonic), flattened frequency-major
+        self.omega = (2 * np.pi / sample_rate * np.outer(self.frequencies, np.arange(1, harmonics + 1))).ravel()
+        self.table = np.exp(1j * np.outer(self.omega, np.arange(self.n)))
+
+        self.history = np.zeros((nc, self.n))  # Window samples, stored at (sample index) % n
+        self.offset = None  # Subtracted from every sample so the sums do not carry the large DC offset of raw EEG
+        self.t = 0  # Absolute index of the next sample
+        self.count = 0  # Samples in the window
+        self.sx = np.zeros(nc)
+        self.sxx = np.zeros((nc, nc))
+        self.sy = np.zeros((nf, nr))
+        self.syy = np.zeros((nf, nr, nr))
+        self.sxy = np.zeros((nf, nc, nr))
+
+    def references(self, start, m):
+        """(frequencies, 2 * harmonics, m) sine/cosine references for samples start to start + m (m <= n)"""
+        z = np.exp(1j * np.mod(self.omega * start, 2 * np.pi))[:, None] * self.table[:, :m]
+        z = z.reshape(len(self.frequencies), self.harmonics, m)
+        return np.concatenate((z.imag, z.real), axis=1)
+
+    def accumulate(self, x, y, sign):
+        self.sx += sign * x.sum(axis=1)
+        self.sxx += sign * (x @ x.T)
+        self.sy += sign * y.sum(axis=2)
+        self.syy += sign * np.matmul(y, y.transpose(0, 2, 1))
+        self.sxy += sign * np.matmul(x[None], y.transpose(0, 2, 1))
+
+    def update(self, chunk):
+        """Add (rows, m) chunk of board data to the window"""
+        x = np.asarray(chunk[self.channels], dtype=np.float64)
+        if not x.shape[1]:
+            return
+        if self.offset is None:
+            self.offset = x[:, 0].copy()
+        x = x - self.offset[:, None]
+        for start in range(0, x.shape[1], self.n):
+            self.add(x[:, start:start + self.n])
+
+    def add(self, x):
+        m = x.shape[1]
+        expired = max(0, self.count + m - self.n)
+        if expired:  # Subtract the oldest samples before their slots are overwritten
+            oldest = self.t - self.count
+            self.accumulate(self.history[:, np.arange(oldest, oldest + expired) % self.n],
+                            self.references(oldest, expired), -1)
+        self.accumulate(x, self.references(self.t, m), 1)
+        self.history[:, np.arange(self.t, self.t + m) % self.n] = x
+        self.t += m
+        self.count = min(self.n, self.count + m)
+
+    @property
+    def ready(self):
+        """True once a full window has been collected"""
+        return self.count == self.n
+
+    def scores(self):
+        """
+        Returns
+        -------
+        rho: np.ndarray
+            Largest canonical correlation between the channels and each frequency's references
+        power: np.ndarray
+            Fraction of channel variance explained by each frequency's harmonics
+        """
+        n = self.count
+        mx, my = self.sx / n, self.sy / n
+        cxx = self.sxx / n - np.outer(mx, mx)
+        cyy = self.syy / n - my[:, :, None] * my[:, None, :]
+        cxy = self.sxy / n - mx[None, :, None] * my[:, None, :]
+        var = np.trace(cxx)
+        flat = np.zeros(len(self.frequencies))
+        if var <= 0:  # Flat or railed window (e.g. electrodes not on yet) has nothing to correlate
+            return flat, flat
+
+        cxx = cxx + self.reg * var / len(self.channels) * np.eye(len(self.channels))
+        try:
+            lx = np.linalg.cholesky(cxx)
+        except np.linalg.LinAlgError:  # Variance left only by rounding in the running sums
+            return flat, flat
+        ly = np.linalg.cholesky(cyy + 1e-12 * np.eye(cyy.shape[-1]))
+        a = np.linalg.solve(lx[None], cxy)
+        b = np.linalg.solve(ly, a.transpose(0, 2, 1))
+        rho = np.linalg.svd(b, compute_uv=False)[:, 0]
+
+        refvar = np.diagonal(cyy, axis1=1, axis2=2)
+        power = np.sum(cxy ** 2 / refvar[:, None, :], axis=(1, 2)) / var
+        return np.clip(rho, 0, 1), power
+
+    def result(self):
+        """Top frequency with its confidence (margin of its correlation over the runner-up) and all scores"""
+        rho, power = self.scores()
+        order = np.argsort(rho)[::-1]
+        top = order[0]
+        second = rho[order[1]] if len(order) > 1 else 0.0
+        return {
+            "time": self.t / self.sample_rate,
+            "frequency": float(self.frequencies[top]),
+            "confidence": float((rho[top] - second) / rho[top]) if rho[top] > 0 else 0.0,
+            "rho": [round(float(r), 4) for r in rho],
+            "power": [round(float(p), 4) for p in power]
+        }
+
+
+def run(client, detector, rate, on_result):
+    """
+    Feed chunks from a StreamClient to detector and call on_result with detector.result() rate times per second
+    of data once the window is full. Returns when the stream ends.
+    """
+    step = max(1, int(detector.sample_rate / rate))
+    due = detector.n
+    for chunk in client:
+        detector.update(chunk)
+        if detector.t >= due:
+            on_result(detector.result())
+            due += step * ((detector.t - due) // step + 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='SSVEP.py',
+                                     description='Prints SSVEP detections for a running collection session as JSON '
+                                                 'lines')
+    parser.add_argument('frequencies', type=float, nargs='+', help="Stimulus frequencies in Hz")
+    parser.add_argument('--port', type=int, default=47800, help="Live stream port of the session")
+    parser.add_argument('--host', default="127.0.0.1", help="Address of the collection machine")
+    parser.add_argument('--window', type=float, default=2.0, help="Window length in seconds")
+    parser.add_argument('--harmonics', type=int, default=2, help="Harmonics per frequency")
+    parser.add_argument('--rate', type=float, default=4.0, help="Detections per second")
+    args = parser.parse_args()
+
+    with StreamClient(args.port, args.host) as stream:
+        meta = stream.metadata
+        ssvep = SSVEPDetector(args.frequencies, occipital_channels(meta), meta["sampling_rate"], args.window,
+                              args.harmonics)
+        run(stream, ssvep, args.rate, lambda res: print(json.dumps(res), flush=True))
@@ -0,0 +1,61 @@
+"""Session states and the shared events that drive them"""
+from threading import Condition
+
+PREPARING = "Preparing"
+READY = "Ready"
+STREAMING = "Streaming"
+STOPPED = "Stopped"
+ERROR = "Error"
+
+
+class ControlEvent:
+    """threading.Event-like flag whose changes wake every wait on its SessionControl"""
+    def __init__(self, control):
+        self.control = control
+        self.flag = False
+
+    def set(self):
+        with self.control.cond:
+            self.flag = True
+            self.control.cond.notify_all()
+
+    def clear(self):
+        with self.control.cond:
+            self.flag = False
+            self.control.cond.notify_all()
+
+    def is_set(self):
+        return self.flag
+
+    def wait(self, timeout=None):
+        return self.control.wait(self, timeout=timeout)
+
+
+class SessionControl:
+    """
+    Start, stop, and error events of a session, sharing one condition so a thread can block on any of them at once
+
+    Sessions of a multi-board recording share one SessionControl, so one start or stop (or an error on any board)
+    reaches them all. Other state changes call notify() so waits on predicates over several sessions are re-checked.
+    """
+    def __init__(self):
+        self.cond = Condition()
+        self.start_event, self.stop_event, self.error_flag = self.event(), self.event(), self.event()
+
+    def event(self):
+        """New event that wakes waits on this control"""
+        return ControlEvent(self)
+
+    def notify(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def wait(self, *events, timeout=None):
+        """Block until any of events is set or timeout seconds pass. Returns whether one is set."""
+        with self.cond:
+            return self.cond.wait_for(lambda: any(e.is_set() for e in events), timeout)
+
+    def wait_for(self, predicate, timeout=None):
+        """Block until predicate() is true, re-checking it whenever an event changes or notify() is called"""
+        with self.cond:
+            return self.cond.wait_for(predicate, timeout)
@@ -0,0 +1,453 @@
+"""Storage helpers shared by the collection bridges"""
+import argparse
+import json
+import math
+import os
+import shutil
+import struct
+
+import numpy as np
+
+from datetime import datetime
+from queue import Queue, Full
+from threading import Thread, Lock
+from time import perf_counter
+
+BIN_MAGIC = b"NDSESS"
+BIN_VERSION = 1
+BIN_HEADER = struct.Struct("<6sHIid")  # magic, version, rows, board id, sample rate
+BIN_HEADER_SIZE = 64
+
+info_lock = Lock()  # Serializes info.json updates made from different threads
+
+
+def create_empty_info():
+    """info.json fields of a new session, with the current date and time"""
+    return {
+        "SessionParams": {
+            "SubjectName": "",
+            "ProjectName": "",
+            "ResponseType": "",
+            "StimulusType": "",
+            "BlockLength": "",
+            "BlockCount": "",
+            "StimCycle": ""
+        },
+        "HardwareParams": {
+            "SampleRate": "",
+            "HeadsetConfiguration": "",
+            "HeadsetModel": "",
+            "BufferSize": "100000"
+        },
+        "Description": "",
+        "Annotations": [],
+        "Date": datetime.now().strftime("%m-%d-%y"),
+        "Time": datetime.now().strftime("%H:%M"),
+        "FileID": ""
+        }
+
+
+def expected_samples(infopath):
+    """Number of samples per row a session described by info.json should produce"""
+    with open(infopath) as i:
+        info = json.load(i)
+    sparams, hparams = info['SessionParams'], info['HardwareParams']
+    return int(sparams['BlockLength']) * int(sparams['BlockCount']) * int(hparams['SampleRate'])
+
+
+def update_info(infopath, key, value, subkey=None):
+    """
+    Set a top-level field of info.json, or info[key][subkey] if subkey is given. The file is replaced atomically so a
+    crash cannot leave it half written.
+    """
+    with info_lock:
+        with open(infopath) as i:
+            info = json.load(i)
+        if subkey is None:
+            info[key] = value
+        else:
+            info.setdefault(key, {})[subkey] = value
+        tmp = infopath + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(info, f, ensure_ascii=False, indent=4)
+        os.replace(tmp, infopath)
+
+
+class InfoJournal:
+    """
+    Append-only journal of the entries of a list in info.json, compacted into it when the session ends
+
+    Each entry is one JSON line appended and fsynced to a file next to info.json, so adding one costs the same
+    however many came before and a crash loses at most the line being written. compact() moves the journaled
+    entries into info.json with an atomic update_info and removes the journal. A journal left behind by a crashed
+    session is compacted when the session folder is opened again.
+
+    Parameters
+    ----------
+    infopath: str
+        Path to the session's info.json
+    key: str
+        info.json list the entries are added to
+    fname: str
+        Name of the journal file
+    """
+    def __init__(self, infopath, key, fname):
+        self.infopath = infopath
+        self.key = key
+        self.path = os.path.join(os.path.dirname(infopath), fname)
+        self.lock = Lock()
+        self.file = None
+        self.compact()
+
+    def append(self, entry):
+        """Durably append entry"""
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def read(self):
+        """Entries in the journal. A torn last line from a crash is skipped."""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
+
+    def compact(self):
+        """Append the journaled entries to info.json's list and remove the journal"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            entries = self.read()
+            if entries:
+                with open(self.infopath) as i:
+                    current = json.load(i).get(self.key, [])
+                update_info(self.infopath, self.key, current + entries)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class AnnotationJournal(InfoJournal):
+    """Journal of a session's annotations in annotations.jsonl, compacted into Annotations (see InfoJournal)"""
+    def __init__(self, infopath):
+        super().__init__(infopath, "Annotations", "annotations.jsonl")
+
+    def add(self, time, note):
+        """Durably append annotation (time in seconds since session start, note)"""
+        self.append([time, note])
+
+
+class SampleStore:
+    """
+    In-memory store of board data made of fixed-size preallocated chunks
+
+    Appending copies new samples into free chunk space and allocates another chunk when the current one fills,
+    so previously stored samples are never moved.
+
+    Parameters
+    ----------
+    rows: int
+        Number of board rows (BoardShim.get_num_rows)
+    expected: int
+        Expected samples per row for the session; enough chunks for this many samples are allocated upfront
+    chunk_len: int
+        Samples per chunk
+    """
+    def __init__(self, rows, expected=0, chunk_len=16384):
+        self.rows = rows
+        self.chunk_len = chunk_len
+        self.chunks = [np.empty((rows, chunk_len)) for _ in range(max(1, math.ceil(expected / chunk_len)))]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, chunk):
+        """Copy (rows, n) chunk into the store"""
+        n = chunk.shape[1]
+        done = 0
+        while done < n:
+            idx, off = divmod(self.count, self.chunk_len)
+            if idx == len(self.chunks):
+                self.chunks.append(np.empty((self.rows, self.chunk_len)))
+            take = min(n - done, self.chunk_len - off)
+            self.chunks[idx][:, off:off + take] = chunk[:, done:done + take]
+            done += take
+            self.count += take
+
+    def window(self, start, stop=None):
+        """
+        Samples in [start, stop) as a (rows, n) array. Negative indices count from the newest sample.
+        Returns a view when the range lies within one chunk, otherwise a copy.
+        """
+        start, stop, _ = slice(start, stop).indices(self.count)
+        if stop <= start:
+            return np.empty((self.rows, 0))
+        first, last = start // self.chunk_len, (stop - 1) // self.chunk_len
+        if first == last:
+            off = first * self.chunk_len
+            return self.chunks[first][:, start - off:stop - off]
+        pieces = []
+        for idx in range(first, last + 1):
+            off = idx * self.chunk_len
+            pieces.append(self.chunks[idx][:, max(start, off) - off:min(stop, off + self.chunk_len) - off])
+        return np.hstack(pieces)
+
+    def latest(self, n):
+        """Most recent n samples (or fewer if not yet collected)"""
+        return self.window(max(0, self.count - n))
+
+
+class CsvAppendWriter:
+    """
+    Incrementally writes board data to a session's data.csv
+
+    The file layout matches np.savetxt(path, data, fmt="%.9f") on the full (rows, samples) session array: one
+    line per board row, samples separated by spaces. Since new samples extend every line, each row is spooled
+    to its own part file and only the new samples are appended per update. The part files are stitched into
+    data.csv once, when the writer is closed.
+
+    Parameters
+    ----------
+    path: str
+        Path to the output csv file
+    rows: int
+        Number of board rows (BoardShim.get_num_rows)
+    fmt: str
+        Format string applied to each sample
+    """
+    def __init__(self, path, rows, fmt="%.9f"):
+        self.path = path
+        self.rows = rows
+        self.fmt = fmt
+        self.partdir = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.parts")
+        self.samples = 0
+        self.closed = False
+
+        os.makedirs(self.partdir, exist_ok=True)
+        self.parts = [open(os.path.join(self.partdir, f"row{r}.part"), 'w') for r in range(rows)]
+
+    def append(self, chunk):
+        """Append (rows, n) chunk of new samples. Returns number of bytes written."""
+        if self.closed:
+            raise ValueError("Writer already closed.")
+        n = chunk.shape[1]
+        if not n:
+            return 0
+        rowfmt = " ".join([self.fmt] * n)
+        sep = " " if self.samples else ""
+        written = 0
+        for part, row in zip(self.parts, chunk):
+            written += part.write(sep + rowfmt % tuple(row))
+        for part in self.parts:
+            part.flush()
+        self.samples += n
+        return written
+
+    def close(self):
+        """Assemble part files into the output file. Safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        for part in self.parts:
+            part.close()
+
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as out:
+            for r in range(self.rows):
+                with open(os.path.join(self.partdir, f"row{r}.part")) as part:
+                    shutil.copyfileobj(part, out)
+                out.write("\n")
+        os.replace(tmp, self.path)
+        shutil.rmtree(self.partdir, ignore_errors=True)
+
+
+class BinaryWriter:
+    """
+    Appends board data to a binary session file
+
+    The file is a BIN_HEADER_SIZE byte header (see BIN_HEADER) followed by little-endian float64 samples stored
+    sample-major, i.e. a C-ordered (samples, rows) array that can be opened with np.memmap (see load_binary).
+
+    Parameters
+    ----------
+    path: str
+        Path to the output file
+    rows: int
+        Number of board rows (BoardShim.get_num_rows)
+    board_id: int
+        BrainFlow board id
+    sample_rate: float
+        Sampling rate of the board in Hz
+    """
+    def __init__(self, path, rows, board_id, sample_rate):
+        self.path = path
+        self.rows = rows
+        self.samples = 0
+        self.closed = False
+        self.file = open(path, 'wb')
+        header = BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, rows, board_id, sample_rate)
+        self.file.write(header.ljust(BIN_HEADER_SIZE, b"\0"))
+        self.file.flush()
+
+    def append(self, chunk):
+        """Append (rows, n) chunk of new samples. Returns number of bytes written."""
+        if self.closed:
+            raise ValueError("Writer already closed.")
+        written = self.file.write(np.ascontiguousarray(chunk.T, dtype="<f8").tobytes())
+        self.file.flush()
+        self.samples += chunk.shape[1]
+        return written
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.file.close()
+
+
+class WriterThread(Thread):
+    """
+    Runs a writer's appends on its own thread, fed through a bounded queue
+
+    put() blocks while the queue is full, so a stalled disk applies backpressure to the caller instead of growing
+    memory without bound. Time spent blocked is recorded in get_stats().
+
+    Parameters
+    ----------
+    writer: BinaryWriter | CsvAppendWriter
+        Writer that performs the actual appends
+    maxsize: int
+        Maximum number of queued chunks
+    on_write: callable
+        Called from the writer thread after a chunk queued with notify=True is written, with the number of bytes
+        written since the previous call
+    on_append: callable
+        Called from the writer thread with the duration in seconds of every append
+    """
+    def __init__(self, writer, maxsize=32, on_write=None, on_append=None):
+        super().__init__(name="WriterThread", daemon=True)
+        self.writer = writer
+        self.path = writer.path
+        self.queue = Queue(maxsize)
+        self.on_write = on_write
+        self.on_append = on_append
+        self.lock = Lock()
+        self.exc = None
+        self.closed = False
+        self.unreported = 0
+        self.stats = {"chunks": 0, "bytes": 0, "write_time": 0.0, "last_write_time": 0.0, "max_write_time": 0.0,
+                      "max_depth": 0, "blocked_puts": 0, "blocked_time": 0.0}
+
+    def put(self, chunk, notify=False):
+        """Queue (rows, n) chunk for writing, blocking while the queue is full"""
+        item = (chunk, notify)
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            start = perf_counter()
+            self.queue.put(item)
+            with self.lock:
+                self.stats["blocked_puts"] += 1
+                self.stats["blocked_time"] += perf_counter() - start
+        with self.lock:
+            self.stats["max_depth"] = max(self.stats["max_depth"], self.queue.qsize())
+
+    def run(self):
+        while (item := self.queue.get()) is not None:
+            if self.exc:  # Drain queue without writing after a failure
+                continue
+            chunk, notify = item
+            try:
+                start = perf_counter()
+                written = self.writer.append(chunk)
+                elapsed = perf_counter() - start
+                with self.lock:
+                    self.stats["chunks"] += 1
+                    self.stats["bytes"] += written
+                    self.stats["write_time"] += elapsed
+                    self.stats["last_write_time"] = elapsed
+                    self.stats["max_write_time"] = max(self.stats["max_write_time"], elapsed)
+                if self.on_append:
+                    self.on_append(elapsed)
+                self.unreported += written
+                if notify and self.on_write:
+                    self.on_write(self.unreported)
+                    self.unreported = 0
+            except Exception as E:
+                self.exc = E
+        self.writer.close()
+
+    def close(self):
+        """Write all queued chunks, then close the writer. Safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+        else:
+            self.writer.close()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, depth=self.queue.qsize())
+
+
+def read_header(path):
+    """Return dict of header fields of a binary session file"""
+    with open(path, 'rb') as f:
+        raw = f.read(BIN_HEADER_SIZE)
+    if len(raw) < BIN_HEADER_SIZE:
+        raise ValueError(f"'{path}' is too short to be a session file.")
+    magic, version, rows, board_id, sample_rate = BIN_HEADER.unpack_from(raw)
+    if magic != BIN_MAGIC:
+        raise ValueError(f"'{path}' is not a session file.")
+    if version != BIN_VERSION:
+        raise ValueError(f"Unsupported session file version {version}.")
+    return {"rows": rows, "board_id": board_id, "sample_rate": sample_rate}
+
+
+def load_binary(path):
+    """
+    Memory-map a binary session file
+
+    Returns
+    -------
+    data: np.memmap
+        Read-only (rows, samples) view of the session, same layout as BoardShim.get_board_data()
+    header: dict
+        Header fields (see read_header)
+    """
+    header = read_header(path)
+    samples = (os.path.getsize(path) - BIN_HEADER_SIZE) // (8 * header['rows'])
+    if not samples:
+        return np.empty((header['rows'], 0)), header
+    data = np.memmap(path, dtype="<f8", mode='r', offset=BIN_HEADER_SIZE, shape=(samples, header['rows']))
+    return data.T, header
+
+
+def export_csv(binpath, csvpath, block=65536):
+    """Write the data.csv equivalent of a binary session file, block samples at a time"""
+    data, header = load_binary(binpath)
+    writer = CsvAppendWriter(csvpath, header['rows'])
+    for start in range(0, data.shape[1], block):
+        writer.append(data[:, start:start + block])
+    writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='SessionIO.py',
+                                     description='Exports data.csv from the data.bin file of a session directory')
+    parser.add_argument('sespath', help="Path to session directory")
+    args = parser.parse_args()
+    export_csv(os.path.join(args.sespath, "data.bin"), os.path.join(args.sespath, "data.csv"))
@@ -0,0 +1,136 @@
+"""Shared-memory ring buffer of recent board data for consumers on the same machine"""
+import argparse
+import time
+
+import numpy as np
+
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+HEADER_SLOTS = 4  # written, rows, capacity, sample rate (int64 slots at the start of the block)
+
+
+class SharedRing:
+    """
+    Ring buffer of the latest board samples in a named shared memory block
+
+    There is one writer (the collection session) and any number of readers in other processes. Every sample is
+    stored twice, at position p and p + capacity, so the latest n samples are always one contiguous slice and
+    readers get NumPy views instead of copies. The writer copies new samples in before advancing the write count
+    in the header, so readers never see samples that are not fully written and no lock is needed.
+
+    A view is only valid until the writer laps it: a window of n samples stays intact for about
+    (capacity - n) / sample_rate seconds after it is taken. Copy it if it must be kept longer.
+
+    Use SharedRing.create in the writer and SharedRing.attach in readers.
+    """
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self.head = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+        self.rows, self.capacity = int(self.head[1]), int(self.head[2])
+        self.sample_rate = float(self.head[3:4].view(np.float64)[0])
+        self.data = np.ndarray((self.rows, 2 * self.capacity), dtype=np.float64, buffer=shm.buf,
+                               offset=8 * HEADER_SLOTS)
+
+    @classmethod
+    def create(cls, name, rows, capacity, sample_rate):
+        """
+        Create the ring as its writer. A block left behind under the same name (e.g. by a crashed session) is
+        replaced; processes still attached to it keep their old copy.
+
+        Parameters
+        ----------
+        name: str
+            Shared memory name readers attach to
+        rows: int
+            Number of board rows (BoardShim.get_num_rows)
+        capacity: int
+            Number of samples kept
+        sample_rate: float
+            Sampling rate of the board in Hz
+        """
+        size = 8 * HEADER_SLOTS + 8 * rows * 2 * capacity
+        try:
+            shm = SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = SharedMemory(name, create=True, size=size)
+        head = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+        head[:3] = 0, rows, capacity
+        head[3:4].view(np.float64)[0] = sample_rate
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open an existing ring as a reader"""
+        shm = SharedMemory(name)
+        # Readers must not unlink the block when they exit (the resource tracker would otherwise do so)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def written(self):
+        """Total number of samples written since the ring was created"""
+        return int(self.head[0])
+
+    def write(self, chunk):
+        """Append (rows, n) chunk. Only the writer may call this."""
+        n = chunk.shape[1]
+        end = self.written + n
+        if n > self.capacity:
+            chunk = chunk[:, -self.capacity:]
+        start = end - chunk.shape[1]
+        pos = start % self.capacity
+        first = min(chunk.shape[1], self.capacity - pos)
+        for off in (0, self.capacity):
+            self.data[:, off + pos:off + pos + first] = chunk[:, :first]
+            self.data[:, off:off + chunk.shape[1] - first] = chunk[:, first:]
+        self.head[0] = end  # Publish only after the samples are in place
+
+    def latest(self, n):
+        """
+        View of the latest n samples (fewer if not yet written) and the write count it ends at
+
+        Returns
+        -------
+        window: np.ndarray
+            (rows, n) view into shared memory, same layout as BoardShim.get_board_data()
+        end: int
+            Value of written for the last sample in the window; pass to since() to get only newer samples
+        """
+        end = self.written
+        n = min(n, end, self.capacity)
+        start = (end - n) % self.capacity
+        return self.data[:, start:start + n], end
+
+    def since(self, index):
+        """Samples written after write count index, as with latest(). Samples already overwritten are skipped."""
+        return self.latest(self.written - index)
+
+    def close(self):
+        """Detach from the ring. The writer also removes it."""
+        self.head = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='SharedRing.py',
+                                     description='Prints the number of samples read from a collection session ring')
+    parser.add_argument('name', nargs='?', default="NeuroData", help="Shared memory name of the ring")
+    args = parser.parse_args()
+    ring = SharedRing.attach(args.name)
+    print(f"{ring.rows} rows, {ring.capacity} samples at {ring.sample_rate} Hz")
+    _, index = ring.latest(0)
+    try:
+        while True:
+            time.sleep(1)
+            window, index = ring.since(index)
+            print(f"{window.shape[1]} new samples ({index} total)")
+    except KeyboardInterrupt:
+        ring.close()
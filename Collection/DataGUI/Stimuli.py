@@ -1,62 +1,230 @@
 """Built-in Stimuli Classes"""
+import math
+import os
 import random
 import time
+import numpy as np
 import simplejson as json
 
-from PyQt5.QtWidgets import (QWidget, QGridLayout, QVBoxLayout, QOpenGLWidget)
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QOpenGLWidget)
 from PyQt5.QtCore import Qt, QRectF, QObject, pyqtSignal
-from PyQt5.QtGui import QColor, QPainter, QPainterPath, QBrush, QFont, QSurfaceFormat
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QBrush, QFont, QSurfaceFormat, QPixmap
+from SessionIO import update_info
 from threading import Thread
-from time import sleep
+from time import perf_counter, sleep
 
 
-class FlashingThread(Thread, QObject):
-    flash_signal = pyqtSignal()
+def ms(seconds):
+    return f"{1000 * seconds:.2f}"
+
+
+def ms_stats(name, seconds, stats=("Mean", "P95", "Max")):
+    """
+    Statistics of seconds in ms under flat keys (OnsetErrorMeanMs, ...), so info.json uploads keep every one as its
+    own column
+    """
+    funcs = {"Mean": np.mean, "P95": lambda v: np.percentile(v, 95), "Min": np.min, "Max": np.max}
+    return {f"{name}{stat}Ms": ms(funcs[stat](seconds)) for stat in stats}
+
+
+class FrameTimes:
+    """
+    Compact in-memory record of one value per frame (timestamps, states), doubling its array when it fills
+
+    Parameters
+    ----------
+    capacity: int
+        Initial number of frames
+    """
+    def __init__(self, capacity=4096):
+        self.values = np.empty(capacity)
+        self.count = 0
+
+    def add(self, value):
+        if self.count == len(self.values):
+            self.values = np.resize(self.values, 2 * len(self.values))
+        self.values[self.count] = value
+        self.count += 1
+
+    @property
+    def array(self):
+        return self.values[:self.count]
+
+
+def frame_report(swaps, period=None):
+    """
+    Frame interval statistics of swap times (seconds)
+
+    Parameters
+    ----------
+    swaps: np.ndarray
+        Time of every presented frame
+    period: float
+        Refresh period; the median frame interval if None
+
+    Returns
+    -------
+    report: dict
+        Frame count, frame rate, jitter of frame intervals around the period (FrameJitterMeanMs, ...), and dropped
+        frames, as strings like the rest of info.json
+    late: np.ndarray
+        Whether each frame interval was longer than 1.5 periods (one or more frames dropped)
+    """
+    intervals = np.diff(swaps)
+    if not len(intervals):
+        return {"Frames": str(len(swaps))}, np.zeros(0, dtype=bool)
+    period = period or float(np.median(intervals))
+    late = intervals > 1.5 * period
+    jitter = np.abs(intervals - period)
+    report = {"Frames": str(len(swaps)),
+              "FrameRate": f"{len(intervals) / (swaps[-1] - swaps[0]):.3f}",
+              **ms_stats("FrameJitter", jitter),
+              "DroppedFrames": str(int(np.sum(np.round(intervals[late] / period) - 1)))}
+    return report, late
+
+
+class GridSurface(QOpenGLWidget):
+    """
+    One vsync-paced surface drawing a grid of stimulus targets
+
+    Each swapped frame requests the next (frameSwapped -> update), so with a swap interval of 1 the grid is
+    repainted once per display refresh, on the GUI thread. The time each frame's swap completed is kept in
+    swap_times. Subclasses draw the targets into cells in paintGL.
+
+    Parameters
+    ----------
+    count: int
+        number of targets
+    rows: int
+        number of rows in grid
+    cols: int
+        number of columns in grid
+    """
+    margin = 9  # px around the grid
+    spacing = 6  # px between targets
 
-    def __init__(self, frequency):
+    def __init__(self, count: int, rows: int, cols: int):
         super().__init__()
-        super(QObject, self).__init__()
-        self.daemon = True
-        self.frequency = frequency
-        self.is_running = True
+        self.count = count
+        self.rows, self.cols = rows, cols
+        self.cells = []
+        self.frames = 0
+        self.running = True
+        self.swap_times = FrameTimes()  # perf_counter() when each frame's swap completed
 
-    def run(self):
-        interval = 1 / (2 * self.frequency)
-        while self.is_running:
-            self.flash_signal.emit()
-            # self.msleep(int(1000 * interval))
-            sleep(interval)
+        fmt = QSurfaceFormat()
+        fmt.setSamples(4)
+        fmt.setSwapInterval(1)
+        fmt.setSwapBehavior(QSurfaceFormat.DoubleBuffer)
+        fmt.setRenderableType(QSurfaceFormat.OpenGL)
+        self.setFormat(fmt)
+        self.frameSwapped.connect(self.next_frame)
+
+    def next_frame(self):
+        if self.running:
+            self.swap_times.add(perf_counter())
+            self.update()
+
+    def resizeGL(self, w, h):
+        cw = (w - 2 * self.margin - (self.cols - 1) * self.spacing) / self.cols
+        ch = (h - 2 * self.margin - (self.rows - 1) * self.spacing) / self.rows
+        self.cells = [QRectF(self.margin + j * (cw + self.spacing), self.margin + i * (ch + self.spacing), cw, ch)
+                      for i in range(self.rows) for j in range(self.cols)][:self.count]
 
     def stop(self):
-        self.is_running = False
+        self.running = False
 
 
-class FlashingBox(QOpenGLWidget):
-    def __init__(self, frequency):
-        super().__init__()
-        self.frequency = frequency
-        self.flash_state = False
-        self.flashing_thread = FlashingThread(frequency)
-        self.flashing_thread.flash_signal.connect(self.toggle_flash)
-        self.flashing_thread.start()
+class FlashGrid(GridSurface):
+    """
+    GridFlash targets on one GridSurface
 
-    def toggle_flash(self):
-        self.flash_state = not self.flash_state
-        self.update()
+    Every target's state is computed per frame from the time since the first frame, so all targets flicker at their
+    exact frequencies however many there are, and a late frame does not shift the ones after it. The time each
+    frame was drawn for is kept alongside its swap time, so timing_report can measure what was actually shown.
+
+    Parameters
+    ----------
+    frequencies: list
+        frequency of each target in Hz
+    rows: int
+        number of rows in grid
+    cols: int
+        number of columns in grid
+    frame_rate: float
+        display refresh rate; if given, frame times are counted in frames (frame / frame_rate) instead of read from
+        the clock, so the pattern stays locked to the display but is delayed by dropped frames
+    """
+    def __init__(self, frequencies, rows: int, cols: int, frame_rate: float = None):
+        super().__init__(len(frequencies), rows, cols)
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.labels = [f'{f:.1f} Hz' for f in frequencies]
+        self.frame_rate = frame_rate
+        self.start = None  # perf_counter() at the first frame
+        self.draw_times = FrameTimes()  # Stimulus time each frame was drawn for
+
+    def states(self, t):
+        """Flash state (True for black) of every target t seconds after the first frame (one row per time if t is an
+        array)"""
+        # The tolerance keeps onsets that fall exactly on a frame (10 Hz at 60 Hz) on that frame despite rounding
+        return (np.multiply.outer(t, self.frequencies) + 1e-9) % 1 < 0.5
 
     def paintGL(self):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        color = QColor(Qt.black) if self.flash_state else QColor(Qt.white)
-        painter.setBrush(QBrush(color))
+        now = perf_counter()
+        if self.start is None:
+            self.start = now
+        t = self.frames / self.frame_rate if self.frame_rate else now - self.start
+        self.frames += 1
+        self.draw_times.add(t)
 
-        painter.drawRect(self.rect())
-        painter.setPen(QColor(Qt.black) if not self.flash_state else QColor(Qt.white))
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
         painter.setFont(QFont('Arial', 16))
-        painter.drawText(self.rect(), Qt.AlignCenter, f'{self.frequency:.1f} Hz')
-
-    def closeEvent(self, event):
-        self.flashing_thread.stop()
+        for rect, label, flash in zip(self.cells, self.labels, self.states(t)):
+            painter.fillRect(rect, Qt.black if flash else Qt.white)
+            painter.setPen(QColor(Qt.white) if flash else QColor(Qt.black))
+            painter.drawText(rect, Qt.AlignCenter, label)
+        painter.end()
+
+    def timing_report(self):
+        """
+        Frame statistics (see frame_report) and, under Target1, Target2, ... in grid order, each target's
+        frequency, the frequency measured from the swap times of its onsets, the error of each onset against the
+        refresh at which an undisturbed display would have shown it, the delay that rounding onsets to refreshes
+        causes by itself, and the dropped frames that delayed one of the target's changes
+
+        A target whose period is not a whole number of frames alternates between the nearest frame counts even on a
+        perfect display. That rounding is reported as FrameQuantizationMs and is not counted in the onset error.
+        Without frame_rate, an onset within the drawing jitter of a refresh can still slip by one frame, and that is
+        counted.
+        """
+        n = min(self.draw_times.count, self.swap_times.count)
+        draws, swaps = self.draw_times.array[:n], self.swap_times.array[:n]
+        report, late = frame_report(swaps, 1 / self.frame_rate if self.frame_rate else None)
+        if n < 2:
+            return report
+        # Refresh each frame was shown at, counting dropped ones, and a fit of the refresh period and the time of
+        # refresh 0 (a median interval is not exact enough to extrapolate over a whole session)
+        intervals = np.diff(swaps)
+        slots = np.concatenate(([0], np.cumsum(np.maximum(1, np.round(intervals / np.median(intervals))))))
+        refresh, first = np.polyfit(slots, swaps, 1)
+        step = 1 / self.frame_rate if self.frame_rate else refresh  # Stimulus time per refresh
+        lead = float(np.median(draws - slots * step))  # Stimulus time drawn for refresh 0
+        states = self.states(draws)
+        onsets = states[1:] & ~states[:-1]
+        changes = states[1:] != states[:-1]
+        for k, f in enumerate(self.frequencies):
+            times = swaps[1:][onsets[:, k]]
+            target = {"FrequencyHz": f"{f:g}", "DroppedFrames": str(int(np.sum(late & changes[:, k])))}
+            if len(times) > 2:
+                nominal = np.floor(draws[1:][onsets[:, k]] * f + 1e-9) / f - lead  # Onset times from refresh 0
+                slot = np.ceil(nominal / step - 1e-6)  # First refresh at or after each nominal onset
+                error = np.abs(times - (first + slot * refresh))
+                target.update({"MeasuredHz": f"{(len(times) - 1) / (times[-1] - times[0]):.4f}",
+                               **ms_stats("OnsetError", error),
+                               "FrameQuantizationMs": ms(np.max(slot * step - nominal))})
+            report[f"Target{k + 1}"] = target
+        return report
 
 
 class GridFlash(QWidget):
@@ -71,13 +239,20 @@ class GridFlash(QWidget):
         number of rows in grid
     cols: int
         number of columns in grid
+    frame_rate: float
+        display refresh rate to count frame times from (see FlashGrid); the clock is used if None
     """
     exit_sig = pyqtSignal()
+    marker_sig = pyqtSignal(str)  # Stimulus onset/offset labels for the board's marker channel
+    log_sig = pyqtSignal(str)  # Lines for the session log
 
-    def __init__(self, frequencies: list, rows: int, cols: int):
+    def __init__(self, frequencies: list, rows: int, cols: int, frame_rate: float = None):
         super().__init__()
         self.setWindowTitle("Grid Flash Stimulus")
-        layout = QGridLayout()
+        self.infopath = None
+        self.reported = False
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
         self.frequencies = frequencies
         self.active = True
         self.setLayout(layout)
@@ -86,39 +261,209 @@ class GridFlash(QWidget):
         p = self.palette()
         p.setColor(self.backgroundRole(), Qt.black)
         self.setPalette(p)
-        self.boxes = []
+        self.grid = FlashGrid(frequencies, rows, cols, frame_rate)
+        layout.addWidget(self.grid)
 
-        n = 0
-        for i in range(rows):
-            for j in range(cols):
-                if n < len(frequencies):
-                    box = FlashingBox(frequencies[n])
-                    self.boxes.append(box)
-                    layout.addWidget(box, i, j)
-                    n += 1
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.close()
 
-        fmt = QSurfaceFormat()
-        fmt.setSamples(4)
-        fmt.setSwapInterval(1)
-        fmt.setSwapBehavior(QSurfaceFormat.DoubleBuffer)
-        fmt.setRenderableType(QSurfaceFormat.OpenGL)
-        QSurfaceFormat.setDefaultFormat(fmt)
+    def showEvent(self, event):
+        self.marker_sig.emit("GridFlashOn")
+    
+    def add_info(self, infopath):
+        self.infopath = infopath
+        with open(infopath, 'r') as i:
+            info = json.loads(i.read())
+        update_info(infopath, 'Description',
+                    info['Description'] + f"\n\nGrid Flash Frequencies: {[round(f, 2) for f in self.frequencies]}")
+
+    def report_timing(self):
+        """Write the grid's measured timing to the session log and to StimulusTiming in info.json"""
+        report = self.grid.timing_report()
+        if "FrameRate" in report:
+            self.log_sig.emit(f"GridFlash: {report['Frames']} frames at {report['FrameRate']} Hz, frame jitter "
+                              f"mean {report['FrameJitterMeanMs']} ms, p95 {report['FrameJitterP95Ms']} ms, max "
+                              f"{report['FrameJitterMaxMs']} ms, {report['DroppedFrames']} dropped frames.")
+            for k in range(len(self.frequencies)):
+                target = report[f"Target{k + 1}"]
+                if "MeasuredHz" in target:
+                    self.log_sig.emit(f"GridFlash {target['FrequencyHz']} Hz: measured {target['MeasuredHz']} Hz, "
+                                      f"onset error mean {target['OnsetErrorMeanMs']} ms, max "
+                                      f"{target['OnsetErrorMaxMs']} ms, {target['DroppedFrames']} dropped frames.")
+        if self.infopath:
+            update_info(self.infopath, 'StimulusTiming', report, subkey="GridFlash")
+
+    def closeEvent(self, event):
+        self.grid.stop()
+        if not self.reported:
+            self.reported = True
+            self.report_timing()
+        self.marker_sig.emit("GridFlashOff")
+        self.exit_sig.emit()
+
+
+def frame_number(name):
+    """Frame number of a sequence frame file (1_on.png, 2.png, ...), or None if name is not one"""
+    stem = name.rsplit(".", 1)[0].split("_")[0]
+    return int(stem) if name.lower().endswith(".png") and stem.isdigit() else None
+
+
+def find_sequences(path):
+    """Frame sequence folders at path: path itself if it holds frames, otherwise its subfolders that do"""
+    def has_frames(folder):
+        return any(frame_number(n) is not None for n in os.listdir(folder))
+    if has_frames(path):
+        return [path]
+    folders = [os.path.join(path, n) for n in sorted(os.listdir(path)) if os.path.isdir(os.path.join(path, n))]
+    return [f for f in folders if has_frames(f)]
+
+
+def load_sequence(folder):
+    """
+    Frame files of a sequence folder, as written by StimulusScripts/framesequence.py or made by hand like
+    StimulusScripts/VideoStimulus (PNG frames numbered in playback order: 1_on.png, 2_on.png, ...)
+
+    Returns
+    -------
+    label: str
+        Frequency of the sequence from its sequence.json, or the folder name
+    paths: list
+        Frame files in playback order
+    refresh_rate: float
+        Refresh rate the sequence was made for, or None if unknown
+    """
+    names = sorted((n for n in os.listdir(folder) if frame_number(n) is not None), key=frame_number)
+    manifest = os.path.join(folder, "sequence.json")
+    label, refresh_rate = os.path.basename(os.path.normpath(folder)), None
+    if os.path.exists(manifest):
+        with open(manifest) as m:
+            meta = json.load(m)
+        label, refresh_rate = f"{meta['frequency']:g} Hz", float(meta['refresh_rate'])
+    return label, [os.path.join(folder, n) for n in names], refresh_rate
+
+
+class SequenceGrid(GridSurface):
+    """
+    Preloaded frame sequences played frame-locked on one GridSurface
+
+    Every frame file is decoded once into a QPixmap, shared by all frames with the same file contents, and scaled
+    to the cell size when the grid is resized, so playback only blits. Frame k of the display shows frame k of
+    every sequence (looping), so a sequence made for the display's refresh rate flickers at its exact frequency.
+
+    Parameters
+    ----------
+    sequences: list
+        frame files of each target in playback order (see load_sequence)
+    rows: int
+        number of rows in grid
+    cols: int
+        number of columns in grid
+    """
+    def __init__(self, sequences, rows: int, cols: int):
+        super().__init__(len(sequences), rows, cols)
+        self.pixmaps = []  # One per distinct frame file content
+        cache = {}
+        self.sequences = []
+        for paths in sequences:
+            indices = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if data not in cache:
+                    pixmap = QPixmap()
+                    if not pixmap.loadFromData(data):
+                        raise ValueError(f"Could not load frame '{path}'.")
+                    cache[data] = len(self.pixmaps)
+                    self.pixmaps.append(pixmap)
+                indices.append(cache[data])
+            self.sequences.append(indices)
+        self.scaled = self.pixmaps
+
+    def resizeGL(self, w, h):
+        super().resizeGL(w, h)
+        if self.cells:
+            size = self.cells[0].size().toSize()
+            self.scaled = [p.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation) for p in self.pixmaps]
+
+    def paintGL(self):
+        k = self.frames
+        self.frames += 1
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        for rect, indices in zip(self.cells, self.sequences):
+            painter.drawPixmap(rect.topLeft(), self.scaled[indices[k % len(indices)]])
+        painter.end()
+
+
+class FramePlayer(QWidget):
+    """
+    Plays frame sequences (see StimulusScripts/framesequence.py) on a grid, one target per sequence
+
+    Parameters
+    ----------
+    path: str
+        sequence folder, or folder of sequence folders
+    """
+    exit_sig = pyqtSignal()
+    marker_sig = pyqtSignal(str)  # Stimulus onset/offset labels for the board's marker channel
+    log_sig = pyqtSignal(str)  # Lines for the session log
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.setWindowTitle("Frame Sequence Stimulus")
+        self.path = path
+        self.infopath = None
+        self.reported = False
+        self.labels, sequences, rates = zip(*(load_sequence(f) for f in find_sequences(path)))
+        self.refresh_rate = rates[0] if len(set(rates)) == 1 else None
+        cols = math.ceil(math.sqrt(len(sequences)))
+        rows = math.ceil(len(sequences) / cols)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self.setMinimumSize(650, 650)
+        p = self.palette()
+        p.setColor(self.backgroundRole(), Qt.black)
+        self.setPalette(p)
+        self.grid = SequenceGrid(sequences, rows, cols)
+        layout.addWidget(self.grid)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
             self.close()
-    
+
+    def showEvent(self, event):
+        display = self.screen().refreshRate()
+        if self.refresh_rate and abs(display - self.refresh_rate) > 1:
+            self.log_sig.emit(f"FramePlayer: sequences were made for {self.refresh_rate:g} Hz but the display runs at "
+                              f"{display:g} Hz, so they will not flicker at their labelled frequencies.")
+        self.marker_sig.emit("FramePlayerOn")
+
     def add_info(self, infopath):
-        with open(infopath, 'r+') as i:
+        self.infopath = infopath
+        with open(infopath, 'r') as i:
             info = json.loads(i.read())
-            info['Description'] += f"\n\nGrid Flash Frequencies: {[round(f, 2) for f in self.frequencies]}"
-            i.seek(0)
-            json.dump(info, i, indent=4, ensure_ascii=True)
-            i.truncate()
+        update_info(infopath, 'Description', info['Description'] + f"\n\nFrame Sequences: {list(self.labels)} "
+                                                                   f"from {self.path}")
+
+    def report_timing(self):
+        """Write the measured frame timing to the session log and to StimulusTiming in info.json"""
+        report, _ = frame_report(self.grid.swap_times.array, 1 / self.refresh_rate if self.refresh_rate else None)
+        if "FrameRate" in report:
+            self.log_sig.emit(f"FramePlayer: {report['Frames']} frames at {report['FrameRate']} Hz, frame jitter "
+                              f"mean {report['FrameJitterMeanMs']} ms, p95 {report['FrameJitterP95Ms']} ms, max "
+                              f"{report['FrameJitterMaxMs']} ms, {report['DroppedFrames']} dropped frames.")
+        if self.infopath:
+            update_info(self.infopath, 'StimulusTiming', report, subkey="FramePlayer")
 
     def closeEvent(self, event):
-        for b in self.boxes:
-            b.close()
+        self.grid.stop()
+        if not self.reported:
+            self.reported = True
+            self.report_timing()
+        self.marker_sig.emit("FramePlayerOff")
         self.exit_sig.emit()
 
 
@@ -152,10 +497,19 @@ class ToggleThread(Thread, QObject):
 
 
 class PromptBox(QOpenGLWidget):
+    prompt_sig = pyqtSignal(bool)  # True when the prompt appears, False when it disappears
+
     def __init__(self, text, times, dur, stime):
         super().__init__()
         self.text = text
+        self.times = times
+        self.dur = dur
+        self.stime = stime
         self.flash_state = False
+        # Wall-clock time (as the prompt schedule) and prompt state of every presented frame
+        self.swap_times = FrameTimes(256)
+        self.swap_states = FrameTimes(256)
+        self.frameSwapped.connect(self.record_frame)
         self.toggle_thread = ToggleThread(times, dur, stime)
         self.toggle_thread.flash_signal.connect(self.toggle_flash)
         self.toggle_thread.start()
@@ -167,6 +521,11 @@ class PromptBox(QOpenGLWidget):
     def toggle_flash(self):
         self.flash_state = not self.flash_state
         self.update()
+        self.prompt_sig.emit(self.flash_state)
+
+    def record_frame(self):
+        self.swap_times.add(time.time())
+        self.swap_states.add(self.flash_state)
 
     def paintGL(self):
         painter = QPainter(self)
@@ -181,6 +540,24 @@ class PromptBox(QOpenGLWidget):
         painter.setPen(QColor(Qt.white) if self.flash_state else QColor(29, 35, 36))
         painter.drawText(rect, Qt.AlignCenter, self.text)
 
+    def timing_report(self):
+        """Presented prompts, the latency of each onset behind its scheduled time, and the presented durations"""
+        swaps, states = self.swap_times.array, self.swap_states.array.astype(bool)
+        changes = np.flatnonzero(states[1:] != states[:-1]) + 1
+        onsets = swaps[changes[states[changes]]]
+        offsets = swaps[changes[~states[changes]]]
+        report = {"Prompts": str(len(onsets)), "Scheduled": str(len(self.times)), "DurationSec": str(self.dur)}
+        if len(onsets):
+            scheduled = self.stime + np.asarray(self.times[:len(onsets)])
+            latency = onsets - scheduled
+            report.update(ms_stats("OnsetLatency", latency))
+        after = np.searchsorted(offsets, onsets, side='right')  # First offset after each onset
+        paired = after < len(offsets)
+        shown = offsets[after[paired]] - onsets[paired]
+        if len(shown):
+            report.update(ms_stats("Duration", shown, ("Mean", "Min", "Max")))
+        return report
+
     def closeEvent(self, event):
         self.toggle_thread.stop()
 
@@ -205,6 +582,8 @@ class RandomPrompt(QWidget):
         How long to leave the prompt on the screen
     """
     exit_sig = pyqtSignal()
+    marker_sig = pyqtSignal(str)  # Prompt onset/offset labels for the board's marker channel
+    log_sig = pyqtSignal(str)  # Lines for the session log
 
     def __init__(self, prompt: str, ppb: int, cooldown: int, stimcycle: str, blength: int, dur: float = 1.5):
         super().__init__()
@@ -218,6 +597,8 @@ class RandomPrompt(QWidget):
         self.dur = dur
         self.times = self.gen_times()
         self.stimwidget = None
+        self.infopath = None
+        self.reported = False
 
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
@@ -275,18 +656,35 @@ class RandomPrompt(QWidget):
     def start(self):
         self.active = True
         box = PromptBox(self.prompt, self.times, self.dur, time.time())
+        box.prompt_sig.connect(lambda on: self.marker_sig.emit("PromptOn" if on else "PromptOff"))
         self.stimwidget = box
         self.layout.addWidget(box)
     
     def add_info(self, infopath):
-        with open(infopath, 'r+') as i:
+        self.infopath = infopath
+        with open(infopath, 'r') as i:
             info = json.loads(i.read())
-            info['Description'] += f"\n\nRandom Prompt Times: {[round(t, 2) for t in self.times]}\nPrompt Text: {self.prompt}"
-            i.seek(0)
-            json.dump(info, i, indent=4, ensure_ascii=True)
-            i.truncate()
+        update_info(infopath, 'Description', info['Description'] + f"\n\nRandom Prompt Times: "
+                                                                   f"{[round(t, 2) for t in self.times]}\n"
+                                                                   f"Prompt Text: {self.prompt}")
+
+    def report_timing(self):
+        """Write the measured prompt timing to the session log and to StimulusTiming in info.json"""
+        report = self.stimwidget.timing_report()
+        line = f"RandomPrompt: {report['Prompts']} of {report['Scheduled']} scheduled prompts shown"
+        if "OnsetLatencyMeanMs" in report:
+            line += f", onset latency mean {report['OnsetLatencyMeanMs']} ms, max {report['OnsetLatencyMaxMs']} ms"
+        if "DurationMeanMs" in report:
+            line += (f", duration {report['DurationMinMs']}-{report['DurationMaxMs']} ms "
+                     f"(nominal {1000 * self.dur:.0f} ms)")
+        self.log_sig.emit(line + ".")
+        if self.infopath:
+            update_info(self.infopath, 'StimulusTiming', report, subkey="RandomPrompt")
 
     def closeEvent(self, event):
         if self.stimwidget:
             self.stimwidget.closeEvent(None)
+            if not self.reported:
+                self.reported = True
+                self.report_timing()
         self.exit_sig.emit()
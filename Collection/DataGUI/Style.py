@@ -1,12 +1,16 @@
 """Widget-derived custom classes and style sheet"""
 import math
+import os
+
+import numpy as np
 
 from abc import ABC, ABCMeta, abstractmethod
 from collections import namedtuple
 from numpy import linspace
-from PyQt5.QtCore import Qt, QFileSystemWatcher
-from PyQt5.QtGui import QIntValidator, QDoubleValidator
-from PyQt5.QtWidgets import QFrame, QPlainTextEdit, QGridLayout, QLabel, QLineEdit
+from PyQt5.QtCore import Qt, QFileSystemWatcher, QTimer
+from PyQt5.QtGui import QIntValidator, QDoubleValidator, QColor, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QFrame, QPlainTextEdit, QGridLayout, QLabel, QLineEdit, QPushButton, QFileDialog
+from Stimuli import find_sequences
 
 
 class StateIndicator(QFrame):
@@ -34,6 +38,114 @@ class StateIndicator(QFrame):
         return self.on
 
 
+class EEGPlot(QFrame):
+    """
+    Scrolling plot of the latest EEG samples, one lane per channel
+
+    Each redraw reduces the latest seconds of data to one (min, max) pair per pixel column, so drawing cost depends
+    on the plot width, not the sampling rate, and the render buffers have a fixed size. Redraws are driven by a
+    timer capped at fps and skipped when no new samples have arrived. Lanes show the signal with its window mean
+    removed; a channel's name turns red when it is near the rail.
+
+    Parameters
+    ----------
+    fps: int
+        Maximum redraws per second
+    seconds: float
+        Length of data shown
+    uv_range: float
+        Peak-to-peak µV that fills a lane
+    rail: float
+        Absolute µV at which a channel counts as railing
+    """
+    label_width = 40
+
+    def __init__(self, fps=20, seconds=10, uv_range=200.0, rail=185000.0):
+        super().__init__()
+        self.setMinimumHeight(200)
+        self.seconds = seconds
+        self.uv_range = uv_range
+        self.rail = rail
+        self.store = None
+        self.channels, self.names = [], []
+        self.sample_rate = 1
+        self.drawn = -1  # Store length at the last redraw
+        self.columns = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000 // fps)
+        self.timer.timeout.connect(self.refresh)
+
+    def set_source(self, store, channels, sample_rate, names=None):
+        """Plot channels (rows) of SessionIO.SampleStore store"""
+        self.store = store
+        self.channels = list(channels)
+        self.names = list(names) if names and len(names) == len(self.channels) else [str(c) for c in self.channels]
+        self.sample_rate = sample_rate
+        self.drawn = -1
+        self.update()
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.refresh()
+
+    def refresh(self):
+        if self.store is not None and len(self.store) != self.drawn and self.isVisible():
+            self.update()
+
+    def decimate(self, width):
+        """(channels, columns) min and max of the latest samples, and the number of columns filled"""
+        if width != self.columns:  # Render buffers are only reallocated when the plot is resized
+            self.columns = width
+            self.mins = np.zeros((len(self.channels), width))
+            self.maxs = np.zeros((len(self.channels), width))
+            self.means = np.zeros((len(self.channels), 1))
+            self.points = QPolygonF(2 * width)
+            ptr = self.points.data()
+            ptr.setsize(2 * width * 16)
+            self.xy = np.frombuffer(ptr, dtype=np.float64).reshape(width, 2, 2)
+        self.drawn = len(self.store)
+        per_col = max(1, math.ceil(self.seconds * self.sample_rate / width))
+        cols = min(width, self.drawn // per_col)
+        if not cols:
+            return 0
+        data = self.store.latest(cols * per_col)[self.channels].reshape(len(self.channels), cols, per_col)
+        np.min(data, axis=2, out=self.mins[:, width - cols:])
+        np.max(data, axis=2, out=self.maxs[:, width - cols:])
+        np.mean(data, axis=(1, 2), out=self.means[:, 0])
+        return cols
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.store is None or not self.channels:
+            return
+        painter = QPainter(self)
+        left, width = self.label_width, max(1, self.width() - self.label_width)
+        lane = self.height() / len(self.channels)
+        cols = self.decimate(width)
+
+        x = np.arange(width - cols, width, dtype=np.float64) + left
+        self.xy[width - cols:, :, 0] = x[:, None]
+        for i, name in enumerate(self.names):
+            center = lane * (i + 0.5)
+            railing = cols and max(abs(self.mins[i, -cols:].min()), abs(self.maxs[i, -cols:].max())) >= self.rail
+            painter.setPen(QColor("#c20808") if railing else QColor("#c5cfde"))
+            painter.drawText(4, int(center + 5), name)
+            if not cols:
+                continue
+            scale = lane / self.uv_range
+            # Zigzag through each column's min and max so one polyline covers the full range of every column
+            self.xy[width - cols:, 0, 1] = center - (self.mins[i, -cols:] - self.means[i, 0]) * scale
+            self.xy[width - cols:, 1, 1] = center - (self.maxs[i, -cols:] - self.means[i, 0]) * scale
+            np.clip(self.xy[width - cols:, :, 1], center - lane / 2, center + lane / 2,
+                    out=self.xy[width - cols:, :, 1])
+            painter.setPen(QPen(QColor("#04d481"), 1))
+            painter.drawPolyline(self.points[2 * (width - cols):] if cols < width else self.points)
+        painter.end()
+
+
 class QABCMeta(ABCMeta, type(QGridLayout)):
     """Metaclass to combine ABC and QGridLayout"""
 
@@ -169,45 +281,156 @@ class RandomPromptMenu(QGridLayout, StimMenu):
                 self.iwindow.fstimcycle.text().strip(), int(self.iwindow.fblength.text()), float(self.fields.dfield.text()))
 
 
+class FramePlayerMenu(QGridLayout, StimMenu):
+    """Menu that corresponds to FramePlayer built-in stimulus."""
+    def __init__(self):
+        super().__init__(stimname="FramePlayer")
+        FieldTuple = namedtuple("FieldTuple", ["pathfield", "browsebutton"])
+        LabelTuple = namedtuple("LabelTuple", ["pathlabel", "browselabel"])
+
+        pathfield = QLineEdit()
+        pathfield.setPlaceholderText("Folder of frame sequences")
+        browsebutton = QPushButton("Browse")
+        browsebutton.clicked.connect(self.browse)
+        self.fields = FieldTuple(pathfield, browsebutton)
+
+        pathlabel = QLabel("Sequences:")
+        browselabel = QLabel("")
+        self.labels = LabelTuple(pathlabel, browselabel)
+
+        self.populate()
+
+    def browse(self):
+        path = QFileDialog.getExistingDirectory(None, "Choose a frame sequence folder")
+        if path:
+            self.fields.pathfield.setText(path)
+
+    def validate(self, window=None):
+        path = self.fields.pathfield.text().strip()
+        if not path:
+            return False, "No sequence folder supplied."
+        if not os.path.isdir(path):
+            return False, "Sequence folder does not exist."
+        if not find_sequences(path):
+            return False, "No frame sequences in folder. (See StimulusScripts/framesequence.py)"
+        return True, ""
+
+    def get_args(self):
+        return self.fields.pathfield.text().strip(),
+
+
 class QTextEditLogger(QPlainTextEdit):
-    """Monitors logfile for updates and prints to GUI"""
-    def __init__(self, filepath, parent_layout=None):
+    """
+    Monitors logfile for updates and prints to GUI
+
+    File change notifications are coalesced: the first one starts a short timer and everything written until it
+    fires is read and appended in one batch, so a burst of log writes causes one repaint. Only the last max_lines
+    lines are kept, and lines below the minimum level are hidden, so memory and repaint cost do not grow with the
+    length of the session.
+
+    Parameters
+    ----------
+    filepath: str
+        Log file to follow
+    parent_layout: QLayout
+        Layout to add the widget to
+    max_lines: int
+        Number of lines kept in the widget
+    interval: int
+        Milliseconds to collect log writes before showing them
+    level: str
+        Minimum BrainFlow log level shown (one of levels)
+    """
+    levels = ("trace", "debug", "info", "warning", "error", "critical")
+    max_read = 1 << 20  # Bytes read from the end of a file that has grown by more than this since the last batch
+
+    def __init__(self, filepath, parent_layout=None, max_lines=2000, interval=250, level="info"):
         super().__init__()
-        self.logfile = open(filepath, buffering=1)
+        self.logfile = open(filepath, buffering=1, errors='replace')
         self.path = filepath
         self.readpos = 0
+        self.min_level = self.levels.index(level)
+        self.show_line = True  # Whether the last line read was shown; lines without a level tag follow it
 
+        self.batch_timer = QTimer(self)
+        self.batch_timer.setSingleShot(True)
+        self.batch_timer.setInterval(interval)
+        self.batch_timer.timeout.connect(self.update_log_window)
         self.watcher = QFileSystemWatcher()
         self.watcher.addPath(filepath)
-        self.watcher.fileChanged.connect(self.update_log_window)
+        self.watcher.fileChanged.connect(self.schedule_update)
 
         self.setReadOnly(True)
         self.setBackgroundVisible(True)
+        self.setMaximumBlockCount(max_lines)
         if parent_layout:
             self.mount(parent_layout)
 
     def mount(self, layout):
         layout.addWidget(self)
 
+    def schedule_update(self):
+        if not self.batch_timer.isActive():
+            self.batch_timer.start()
+
+    def line_level(self, line):
+        """Index in levels of the level tag of a BrainFlow log line ("[time] [logger] [level] message"), or None"""
+        parts = line.split("] [", 2)
+        if len(parts) < 3:
+            return None
+        tag = parts[2].split("]", 1)[0]
+        return self.levels.index(tag) if tag in self.levels else None
+
     def update_log_window(self):
         if self.logfile.closed:
             return
-        self.logfile.seek(self.readpos)
-        line = self.logfile.read()
-        self.appendPlainText(line)
-        self.readpos = self.logfile.tell()
+        size = self.logfile.seek(0, 2)
+        if size < self.readpos:  # File was truncated or replaced
+            self.readpos = 0
+        if size - self.readpos > self.max_read:  # Older lines would be dropped by the block limit anyway
+            self.readpos = size - self.max_read
+            self.logfile.seek(self.readpos)
+            self.logfile.readline()
+        else:
+            self.logfile.seek(self.readpos)
+        text = self.logfile.read()
+        end = text.rfind("\n") + 1  # Leave a partly written last line for the next batch
+        if not end:
+            return
+        self.readpos = self.logfile.tell() - len(text[end:].encode(self.logfile.encoding, 'replace'))
+        shown = []
+        for line in text[:end].splitlines():
+            level = self.line_level(line)
+            if level is not None:
+                self.show_line = level >= self.min_level
+            if self.show_line:
+                shown.append(line)
+        if shown:
+            self.appendPlainText("\n".join(shown))
+
+    def set_level(self, level):
+        """Show lines at level and above, re-reading the retained part of the log"""
+        self.min_level = self.levels.index(level)
+        self.clear()
+        self.readpos = 0
+        self.show_line = True
+        self.update_log_window()
 
     def reset_file(self, filepath):
+        self.batch_timer.stop()
         if self.path:
             self.watcher.removePath(self.path)
         if not self.logfile.closed:
             self.logfile.close()
-        self.logfile = open(filepath, buffering=1)
+        self.logfile = open(filepath, buffering=1, errors='replace')
         self.watcher.addPath(filepath)
         self.path = filepath
         self.readpos = 0
+        self.show_line = True
 
     def end(self):
+        self.batch_timer.stop()
+        self.update_log_window()  # Show what was written since the last batch
         self.logfile.close()
         self.watcher.removePath(self.path)
         self.path = None
@@ -237,6 +460,7 @@ class Style:
     #FieldLabels { font-weight: bold; }
     #ErrorLabel { color: #c20808 }
     #MenuLabel { font-size: 14px; }
+    #PerfLabel { font-size: 13px; }
     #Divider { background-color: #6c6f70; }
     QPushButton {
         background-color: #007bff;
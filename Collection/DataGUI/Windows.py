@@ -1,6 +1,7 @@
 import BoardBridge
 import BoardlessBridge
 
+from Acquisition import MarkerCodes
 from brainflow import BrainFlowInputParams, BrainFlowError, LogLevels
 from brainflow.board_shim import BoardShim
 from datetime import datetime
@@ -8,38 +9,19 @@ from PyQt5.QtCore import Qt, QTimer, QTime, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QIntValidator
 from PyQt5.QtWidgets import (QFrame, QLabel, QLineEdit, QTextEdit, QComboBox, QPushButton, QFileDialog, 
                              QVBoxLayout, QHBoxLayout, QGridLayout)
-from threading import Thread
-from time import sleep
-from Style import StateIndicator, QTextEditLogger, GridStimMenu, RandomPromptMenu
-from Stimuli import GridFlash, RandomPrompt
+from SessionControl import READY, STREAMING, ERROR
+from SessionIO import AnnotationJournal, create_empty_info
+from Style import StateIndicator, QTextEditLogger, GridStimMenu, RandomPromptMenu, FramePlayerMenu, EEGPlot
+from Stimuli import FramePlayer, GridFlash, RandomPrompt
 
 import json
 import os
 
 
-def create_empty_info():
-    return {
-        "SessionParams": {
-            "SubjectName": "",
-            "ProjectName": "",
-            "ResponseType": "",
-            "StimulusType": "",
-            "BlockLength": "",
-            "BlockCount": "",
-            "StimCycle": ""
-        },
-        "HardwareParams": {
-            "SampleRate": "",
-            "HeadsetConfiguration": "",
-            "HeadsetModel": "",
-            "BufferSize": "100000"
-        },
-        "Description": "",
-        "Annotations": [],
-        "Date": datetime.now().strftime("%m-%d-%y"),
-        "Time": datetime.now().strftime("%H:%M"),
-        "FileID": ""
-        }
+def set_text(label, text):
+    """Set label text only if it changed, so unchanged labels do not trigger a relayout"""
+    if label.text() != text:
+        label.setText(text)
 
 
 def init_combobox(cbox, default, *options):
@@ -86,10 +68,15 @@ class InfoWindow(PageWindow):
     boardmap = {'Cyton': (0, 250),
                 'CytonDaisy': (2, 125)}
     stimmap = {'GridFlash': GridFlash,
-               'RandomPrompt': RandomPrompt}
+               'RandomPrompt': RandomPrompt,
+               'FramePlayer': FramePlayer}
     buffsize_d = 100000
     buffsize_max = 450000
     buffsize_min = 3000
+    stream_port_d = 47800  # Suggested local port of the live data stream (see LiveStream.py)
+    ring_name_d = "NeuroData"  # Suggested shared memory name of the latest data (see SharedRing.py)
+    mains_freq = 60  # Notch frequency of the online filter
+    filter_band = (1.0, 50.0)  # Bandpass of the online filter
     blengthmax = 3600
     bcountmax = 360
 
@@ -104,7 +91,8 @@ class InfoWindow(PageWindow):
         self.sespath = None
         self.infodict['Date'] = self.date
         self.infodict['Time'] = self.time
-        self.board = None
+        self.boards = []
+        self.ports = []
         self.stimscript = None
 
         # Directory Row
@@ -157,6 +145,7 @@ class InfoWindow(PageWindow):
         self.buffsize = QLabel("Buffer size (samples):")
         self.serialport = QLabel("Board serial port: ")
         self.stimscript = QLabel("Stimulus script:")
+        self.filter = QLabel("Online filter:")
         self.fconfig = QComboBox()
         init_combobox(self.fconfig, "standard", "Standard", "Occipital", "Other")
         self.fmodel = QComboBox()
@@ -165,10 +154,24 @@ class InfoWindow(PageWindow):
         self.fbuffsize.setPlaceholderText(str(self.buffsize_d))
         self.fbuffsize.setValidator(QIntValidator(self.buffsize_min, self.buffsize_max))
         self.fserialport = QLineEdit()
-        self.fserialport.setPlaceholderText("Ex: COM4")
+        self.fserialport.setPlaceholderText("Ex: COM4 or COM4, COM5")
         self.fstimscript = QComboBox()
-        init_combobox(self.fstimscript, "External/None", "External/None", "Grid Flash", "Random Prompting")
+        init_combobox(self.fstimscript, "External/None", "External/None", "Grid Flash", "Random Prompting",
+                      "Frame Sequence")
         self.fstimscript.currentTextChanged.connect(self.stim_config)
+        self.ffilter = QComboBox()
+        init_combobox(self.ffilter, "None", "None", "Notch + Bandpass", "Notch + Bandpass + CAR")
+
+        # Live Data Sharing (off unless filled in)
+        self.liveframe = QFrame()
+        self.liveframe.setFrameStyle(QFrame.Panel | QFrame.Plain)
+        self.streamport = QLabel("Live stream port:")
+        self.fstreamport = QLineEdit()
+        self.fstreamport.setPlaceholderText(f"Off (Ex: {self.stream_port_d})")
+        self.fstreamport.setValidator(QIntValidator(1024, 65535))
+        self.ringname = QLabel("Shared memory ring:")
+        self.fringname = QLineEdit()
+        self.fringname.setPlaceholderText(f"Off (Ex: {self.ring_name_d})")
 
         # Confirmation
         self.confirm_button = QPushButton("Confirm")
@@ -219,6 +222,8 @@ class InfoWindow(PageWindow):
         hardlayout.setRowStretch(6, 5)
         hardlayout.setRowStretch(7, 1)
         hardlayout.setRowMinimumHeight(6, 2)
+        hardlayout.addWidget(self.filter, 0, 0)
+        hardlayout.addWidget(self.ffilter, 0, 1)
         hardlayout.addWidget(self.config, 1, 0)
         hardlayout.addWidget(self.fconfig, 1, 1)
         hardlayout.addWidget(self.model, 2, 0)
@@ -237,6 +242,14 @@ class InfoWindow(PageWindow):
         rightlayout.addWidget(self.hardframe)
         self.hardlayout = hardlayout
 
+        # Live Data Sharing
+        livelayout = QGridLayout(self.liveframe)
+        livelayout.addWidget(self.streamport, 0, 0)
+        livelayout.addWidget(self.fstreamport, 0, 1)
+        livelayout.addWidget(self.ringname, 1, 0)
+        livelayout.addWidget(self.fringname, 1, 1)
+        rightlayout.addWidget(self.liveframe)
+
         middlebar.addLayout(rightlayout)
 
         layout.addLayout(middlebar)
@@ -266,27 +279,47 @@ class InfoWindow(PageWindow):
         else:
             self.errlabel.setText(" ")
             self.save_info()
-            if self.board:
-                self.start(False)
-            else:
-                self.start(True)
+            self.start(not self.boards)
+
+    def serial_ports(self):
+        """Serial ports entered by the user, one per board"""
+        return [p.strip() for p in self.fserialport.text().split(",") if p.strip()]
+
+    def live_port(self):
+        """Live stream port entered by the user, None if the stream is off"""
+        port = self.fstreamport.text().strip()
+        return int(port) if port else None
 
     def start(self, new):
         """Create new collection session and proceed to collection window"""
-        if new:
-            params = BrainFlowInputParams()
-            params.serial_port = self.fserialport.text()
+        ports = self.serial_ports()
+        if ports != self.ports:  # Boards are reused between sessions unless the ports change
             bid = self.boardmap[self.fmodel.currentText()][0]
-            try:
-                self.board = BoardShim(bid, params)
-            except BrainFlowError as E:
-                self.errlabel.setText(f"Error creating BoardShim object.\n{E}")
-                return
-
-        if self.boardless:
-            session = BoardlessBridge.CollectionSession(self.board, self.sespath, int(self.fbuffsize.text()))
+            boards = []
+            for port in ports:
+                params = BrainFlowInputParams()
+                params.serial_port = port
+                try:
+                    boards.append(BoardShim(bid, params))
+                except BrainFlowError as E:
+                    self.errlabel.setText(f"Error creating BoardShim object.\n{E}")
+                    return
+            for board in self.boards:
+                if board.is_prepared():
+                    board.release_session()
+            self.boards, self.ports = boards, ports
+
+        bridge = BoardlessBridge if self.boardless else BoardBridge
+        buffsize = int(self.fbuffsize.text())
+        filters = self.filter_settings()
+        stream_port = self.live_port()
+        ring_name = self.fringname.text().strip() or None
+        if len(self.boards) == 1:
+            session = bridge.CollectionSession(self.boards[0], self.sespath, buffsize, stream_port=stream_port,
+                                               ring_name=ring_name, filters=filters)
         else:
-            session = BoardBridge.CollectionSession(self.board, self.sespath, int(self.fbuffsize.text()))
+            session = BoardBridge.MultiBoardSession(self.boards, self.sespath, buffsize, bridge.CollectionSession,
+                                                    stream_port=stream_port, ring_name=ring_name, filters=filters)
 
         ipath = os.path.join(self.sespath, "info.json")
         if self.stimscript:
@@ -294,6 +327,13 @@ class InfoWindow(PageWindow):
         self.colwin.init_session(ipath, session, new, stim=self.stimscript)
         self.goto("collect")
 
+    def filter_settings(self):
+        """StreamFilter settings for the selected online filter, None if off"""
+        choice = self.ffilter.currentText()
+        if choice == "None":
+            return None
+        return {'notch': self.mains_freq, 'band': self.filter_band, 'car': choice.endswith("CAR")}
+
     def check_info(self):
         """Validate info"""
         if not self.curdir.text().strip():
@@ -341,6 +381,12 @@ class InfoWindow(PageWindow):
             return False, f"Buffer size too low. (Min: {self.buffsize_min})"
         if not self.fserialport.text().strip():
             return False, "No serial port supplied."
+        ports = self.serial_ports()
+        if len(set(ports)) != len(ports):
+            return False, "Serial port listed more than once."
+        port = self.live_port()
+        if port is not None and not 1024 <= port <= 65536 - len(ports):  # Board i streams on port + i
+            return False, f"Live stream port out of range. (1024 to {65536 - len(ports)})"
         
         menu = self.hardlayout.itemAtPosition(6, 0)
         if menu and not (res := menu.validate(self))[0]:
@@ -392,13 +438,24 @@ class InfoWindow(PageWindow):
             self.hardlayout.addLayout(GridStimMenu(), 6, 0, 1, 2)
         elif new == "Random Prompting":
             self.hardlayout.addLayout(RandomPromptMenu(), 6, 0, 1, 2)
+        elif new == "Frame Sequence":
+            self.hardlayout.addLayout(FramePlayerMenu(), 6, 0, 1, 2)
 
 
 class CollectionWindow(PageWindow):
     """Displays session controls and real time information (timers, logs, active state)"""
+    # Emitted from the collection thread on session state changes and handled in the GUI thread
+    state_sig = pyqtSignal(object, str)
+    refresh_margin = 2  # ms after a second boundary to refresh the status display, so it never fires early
+
     def __init__(self):
         super().__init__()
         self.setObjectName("FullFrame")
+        self.state_sig.connect(self.on_state)
+        self.status_text = ""
+        self.status_dots = 0
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.animate_status)
 
     def init_session(self, infopath, csession, new=True, stim=None):
         """Set up for collection session
@@ -431,13 +488,22 @@ class CollectionWindow(PageWindow):
         self.stim = stim
         if self.stim:
             self.stim.exit_sig.connect(self.end_stim)
+            self.stim.marker_sig.connect(self.mark)
+            self.stim.log_sig.connect(lambda line: self.csession.log_message(LogLevels.LEVEL_INFO, f"[GUI]: {line}"))
+        self.markers = MarkerCodes(infopath)
+        self.journal = AnnotationJournal(infopath)
 
         self.session_status = "Preparing"
         self.current_block = 0
         self.start_time = None
         self.t = 0
         self.complete = False
+        # Fires once per displayed second rather than at a fixed rate (see schedule_refresh)
         self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
 
         if new:
             self.build_frame()
@@ -462,10 +528,12 @@ class CollectionWindow(PageWindow):
         infslabel = QLabel("Session status:")
         infslabel.setStyleSheet("font-weight: bold")
         block_status = QLabel()
+        perf_info = QLabel()
+        perf_info.setObjectName("PerfLabel")
         self.state_indicator = StateIndicator("#04d481", "black")
         self.status_panel = StatusPanel(status_label, status_info, block_status, 
                                         timer_label, stimer_label, 
-                                        self.state_indicator, infslabel)
+                                        self.state_indicator, infslabel, perf_info)
 
         # Buttons and top level widgets
         self.entry_button = QPushButton("Mark Event")
@@ -481,6 +549,9 @@ class CollectionWindow(PageWindow):
         self.stop_button.clicked.connect(self.pause_stream)
         self.stop_button.setDisabled(True)
 
+        # Live Plot
+        self.eeg_plot = EEGPlot()
+
         # Log Box
         log_label = QLabel("Session Logs")
         log_label.setObjectName("FieldLabels")
@@ -493,10 +564,12 @@ class CollectionWindow(PageWindow):
         gridlayout.setColumnStretch(0, 1)
         gridlayout.setColumnStretch(1, 2)
         gridlayout.setRowStretch(2, 1)
+        gridlayout.setRowStretch(3, 1)
         
         gridlayout.addWidget(self.info_panel, 0, 0, 2, 1)
         gridlayout.addWidget(self.status_panel, 0, 1)
-        gridlayout.addWidget(self.log_panel, 2, 0, 1, 2)
+        gridlayout.addWidget(self.eeg_plot, 2, 0, 1, 2)
+        gridlayout.addWidget(self.log_panel, 3, 0, 1, 2)
 
         buttonlayout = QGridLayout()
         buttonlayout.addWidget(self.entry_annotation, 0, 0, 1, 3)
@@ -515,41 +588,57 @@ class CollectionWindow(PageWindow):
         self.log_panel.reset(self.infopath, self.csession)
         self.status_panel.set_block_time("00:00")
         self.status_panel.set_session_time("00:00")
+        self.status_panel.set_perf(None)
+        bid = self.csession.board.board_id
+        self.eeg_plot.set_source(self.csession.data, BoardShim.get_eeg_channels(bid), BoardShim.get_sampling_rate(bid),
+                                 BoardShim.get_board_descr(bid).get('eeg_names', "").split(","))
         self.update_status()
-        ready_thread = Thread(target=self.wait_for_ready, name="ReadyThread")
-        ready_thread.start()
+        self.show_progress("Preparing")
+        session = self.csession
+        session.add_listener(lambda state: self.state_sig.emit(session, state))
         self.csession.start()
 
-    def wait_for_ready(self):
-        """Show preparation status"""
-        i = 0
-        while not (ready := self.ready_flag.is_set()) and not self.error_flag.is_set() and not self.stop_event.is_set():
-            infostat = "Preparing" + "." * i
-            self.status_panel.set_session_status(infostat)
-            i = (i+1) % 4
-            sleep(0.5)
-        if ready:
+    @pyqtSlot(object, str)
+    def on_state(self, session, state):
+        """Update the window for a state change of the collection session"""
+        if session is not self.csession:  # Late signal from a previous session
+            return
+        if state == READY:
+            self.status_timer.stop()
             self.status_panel.set_session_status("Ready")
             self.start_button.setDisabled(False)
-        elif self.error_flag.is_set():
-            infostat = self.csession.get_error()
-            self.status_panel.set_session_status(infostat, error=True)
-
-    def show_ongoing(self):
-        """Show collecting status"""
-        i = 0
-        while not self.stop_event.is_set() and not self.error_flag.is_set():
-            infostat = "Collecting" + "." * i
-            self.status_panel.set_session_status(infostat)
-            i = (i+1) % 4
-            sleep(0.5)
+        elif state == STREAMING and not self.stop_event.is_set():
+            self.show_progress("Collecting")
+        elif state == ERROR:
+            self.status_timer.stop()
+            if self.start_time:
+                self.stop_session()
+            else:
+                self.status_panel.set_session_status(self.csession.get_error(), error=True)
+
+    def show_progress(self, text):
+        """Show text in the session status with animated dots until the next state change"""
+        self.status_text = text
+        self.status_dots = 0
+        self.animate_status()
+        self.status_timer.start(500)
+
+    def animate_status(self):
+        self.status_panel.set_session_status(self.status_text + "." * self.status_dots)
+        self.status_dots = (self.status_dots + 1) % 4
 
     def add_annotation(self, time, note):
         self.info['Annotations'].append([time, note])
-        with open(self.infopath, 'w') as file:
-            json.dump(self.info, file, ensure_ascii=False, indent=4)
+        # Journaled now and compacted into info.json when the session ends
+        self.journal.add(time, note)
         self.csession.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Annotation saved - '{note}'")
 
+    def mark(self, label):
+        """Insert the marker code for label into the data stream of the board(s)"""
+        code = self.markers.code(label)
+        if self.csession.insert_marker(code):
+            self.csession.log_message(LogLevels.LEVEL_INFO, f"[GUI]: Marker {code} inserted - '{label}'")
+
     def on_enter_annotation(self):
         if not self.start_time:
             return
@@ -559,6 +648,7 @@ class CollectionWindow(PageWindow):
         if not annotation:
             annotation = f"t{self.t}"
 
+        self.mark(annotation)
         self.add_annotation(timestamp, annotation)
         self.entry_annotation.clear()
         self.entry_annotation.setPlaceholderText(self.tlabel())
@@ -584,11 +674,6 @@ class CollectionWindow(PageWindow):
             self.state_indicator.set_active(False)
 
     def update_timer(self):
-        if self.error_flag.is_set():
-            self.status_panel.set_session_status(self.csession.get_error(), error=True)
-            self.stop_session()
-            return
-
         elapsed_time = datetime.now() - self.start_time
         elapsed_seconds = int(elapsed_time.total_seconds())
         remaining_seconds = max(0, self.blength - (elapsed_seconds % self.blength))
@@ -596,11 +681,28 @@ class CollectionWindow(PageWindow):
         self.status_panel.set_block_time(formatted_time)
         self.status_panel.set_session_time(QTime(0, 0).addSecs(elapsed_seconds).toString("mm:ss"))
 
-        self.update_status()
         self.update_block(elapsed_time)
+        if not self.stop_event.is_set():  # Not stopped by the end of the last block
+            self.update_status()
+            self.schedule_refresh()
+
+    def schedule_refresh(self):
+        """
+        Run update_timer just after the next whole second of session time. The timers, block info, and block
+        transitions only change on whole seconds (block lengths are whole seconds), so this is the only time the
+        status display needs refreshing.
+        """
+        elapsed_ms = int((datetime.now() - self.start_time).total_seconds() * 1000)
+        self.timer.start(1000 - elapsed_ms % 1000 + self.refresh_margin)
+
+    def update_stats(self):
+        self.status_panel.set_perf(self.csession.get_stats())
 
     def update_block(self, elapsed):
-        self.current_block = int(elapsed.total_seconds() / self.blength) + 1
+        block = int(elapsed.total_seconds() / self.blength) + 1
+        if self.current_block < block <= self.bcount:
+            self.mark("BlockStart")
+        self.current_block = block
         if self.current_block > self.bcount:
             self.session_status = "Complete"
             self.current_block = self.bcount
@@ -610,13 +712,14 @@ class CollectionWindow(PageWindow):
     def start_session(self):
         if not self.ready_flag.is_set():
             return
-        ongoing_thread = Thread(target=self.show_ongoing, name="OngoingThread")
-        ongoing_thread.start()
         self.start_event.set()
         self.current_block = 1
         self.start_time = datetime.now()
+        self.mark("BlockStart")  # Held by the session until the stream is running
         self.timer.timeout.connect(self.update_timer)
-        self.timer.start(10)  # Timer interval in milliseconds
+        self.schedule_refresh()
+        self.stats_timer.start(1000)
+        self.eeg_plot.start()
         self.entry_button.setDisabled(False)
         self.start_button.setDisabled(True)
         self.stop_button.setDisabled(False)
@@ -642,7 +745,11 @@ class CollectionWindow(PageWindow):
     def pause_stream(self):
         self.stop_event.set()
         self.log_panel.end_log()
+        self.journal.compact()
+        self.status_timer.stop()
         self.timer.stop()
+        self.stats_timer.stop()
+        self.eeg_plot.stop()
         self.state_indicator.set_active(False)
         self.stop_button.setDisabled(True)
         self.entry_button.setDisabled(True)
@@ -653,6 +760,7 @@ class CollectionWindow(PageWindow):
             self.status_panel.set_session_status(self.csession.get_error(), error=True)
         if self.stim:
             self.stim.close()
+        self.markers.compact()  # After the stimulus closes, since closing marks its offset
 
     def end_stim(self):
         self.stim.close()
@@ -662,7 +770,11 @@ class CollectionWindow(PageWindow):
     def stop_session(self):
         self.stop_event.set()
         self.log_panel.end_log()
+        self.journal.compact()
+        self.status_timer.stop()
         self.timer.stop()
+        self.stats_timer.stop()
+        self.eeg_plot.stop()
         self.state_indicator.set_active(False)
         self.stop_button.setDisabled(True)
         self.entry_button.setDisabled(True)
@@ -672,6 +784,7 @@ class CollectionWindow(PageWindow):
             self.status_panel.set_session_status("Complete", error=False)
         if self.stim:
             self.stim.close()
+        self.markers.compact()
 
     def tlabel(self):
         self.t += 1
@@ -717,14 +830,16 @@ class InfoPanel(QFrame):
 
 class StatusPanel(QFrame):
     def __init__(self, status_label, status_info, block_status, 
-                 block_timer, session_timer, state_indicator, infslabel):
+                 block_timer, session_timer, state_indicator, infslabel, perf_info):
         super().__init__()
         self.setFrameStyle(QFrame.Panel | QFrame.Plain)
         self.status_info = status_info
+        self.perf_info = perf_info
         self.btimer = block_timer
         self.stimer = session_timer
         self.state_indicator = state_indicator
         self.block_status = block_status
+        self.status_error = None
 
         layout = QGridLayout(self)
         layout.setRowStretch(2, 1)
@@ -736,28 +851,40 @@ class StatusPanel(QFrame):
         layout.addWidget(session_timer, 0, 2, Qt.AlignTop | Qt.AlignRight)
         layout.addWidget(infslabel, 2, 0, 1, 2, Qt.AlignBottom | Qt.AlignLeft)
         layout.addWidget(status_info, 2, 2, 1, 2, Qt.AlignBottom | Qt.AlignLeft)
+        layout.addWidget(perf_info, 3, 0, 1, 4, Qt.AlignBottom | Qt.AlignLeft)
     
     def set_session_status(self, status, error=False):
         """Set label next to Session Status"""
-        if error:
-            self.status_info.setStyleSheet("color: #c20808")
-        else:
-            self.status_info.setStyleSheet("color: #c5cfde")
-        self.status_info.setText(status[:25])
+        if error != self.status_error:  # Restyling is costly, so only when the error state changes
+            self.status_error = error
+            if error:
+                self.status_info.setStyleSheet("color: #c20808")
+            else:
+                self.status_info.setStyleSheet("color: #c5cfde")
+        set_text(self.status_info, status[:25])
     
     def set_block_info(self, status):
         """Set block number and next block state"""
-        self.block_status.setText(status)
+        set_text(self.block_status, status)
     
     def set_block_time(self, time_string):
-        self.btimer.setText(time_string)
+        set_text(self.btimer, time_string)
     
     def set_session_time(self, time_string):
-        self.stimer.setText(time_string)
+        set_text(self.stimer, time_string)
 
     def set_active(self, active):
         self.state_indicator.set_active(active)
 
+    def set_perf(self, stats):
+        """Show acquisition performance figures from CollectionSession.get_stats()"""
+        if not stats:
+            self.perf_info.setText("-- samples/s | drain -- ms | write -- ms\n-- MB written | buffer --% | queue --")
+            return
+        self.perf_info.setText(f"{stats['samples_per_sec']:.1f} samples/s | drain {stats['drain_ms']:.1f} ms | "
+                               f"write {stats['write_ms']:.1f} ms\n{stats['bytes_written'] / 1e6:.1f} MB written | "
+                               f"buffer {stats['buffer_fill']:.0%} | queue {stats['queue_depth']}")
+
 
 def init_logbox(ipath, session):
     """Pass logfile to BoardShim and set up for GUI log window"""
@@ -772,18 +899,25 @@ class LogPanel(QFrame):
         self.setFrameStyle(QFrame.Panel | QFrame.Plain)
         self.log_label = log_label
         self.logbox = init_logbox(ipath, session)
+        self.flevel = QComboBox()
+        init_combobox(self.flevel, "Info", "Info", "Warning", "Error", "Debug")
+        self.flevel.currentTextChanged.connect(lambda level: self.logbox.set_level(level.lower()))
 
         layout = QVBoxLayout(self)
-        layout.addWidget(log_label, Qt.AlignTop | Qt.AlignLeft)
+        header = QHBoxLayout()
+        header.addWidget(log_label, 1, Qt.AlignLeft)
+        header.addWidget(self.flevel, 0, Qt.AlignRight)
+        layout.addLayout(header, 1)
         self.logbox.mount(layout)
-        layout.setStretchFactor(log_label, 1)
         layout.setStretchFactor(self.logbox, 10)
 
     def reset(self, ipath, session):
         self.logbox.clear()
+        self.flevel.setDisabled(False)
         newfile = os.path.join(os.path.normpath(ipath + os.sep + os.pardir), "sessionlog.log")
         session.activate_logger(newfile)
         self.logbox.reset_file(newfile)
 
     def end_log(self):
         self.logbox.end()
+        self.flevel.setDisabled(True)  # Nothing left to re-read once the log is closed
@@ -49,7 +49,11 @@ class DataCollectionGUI(QMainWindow):
     def closeEvent(self, event):
         cwin = self.pages.get('collect', None)
         if self.stack.currentWidget() == cwin:
-            cwin.csession.error_flag.set()
+            cwin.csession.abort()
+            if cwin.csession.is_alive():  # Let the session flush its writers and close its files
+                cwin.csession.join(timeout=10)
+            cwin.journal.compact()
+            cwin.markers.compact()
         event.accept()
 
 
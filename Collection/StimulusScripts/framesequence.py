@@ -0,0 +1,96 @@
+"""Generates frame-exact SSVEP frame sequences (PNG frames + sequence.json) for the FramePlayer stimulus"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from fractions import Fraction
+from PyQt5.QtGui import QImage, QColor
+
+
+def frame_levels(frequency, refresh_rate, phase=0.0, waveform="square", max_frames=600):
+    """
+    Intensity (0 to 1) of every frame of one period of the sequence
+
+    The period is the smallest whole number of frames holding a whole number of cycles, so the sequence loops
+    without a seam. Frequencies that would need more than max_frames are rounded to the nearest one that does not.
+
+    Parameters
+    ----------
+    frequency: float
+        Flicker frequency in Hz
+    refresh_rate: float
+        Monitor refresh rate in Hz
+    phase: float
+        Phase offset in cycles (0 to 1)
+    waveform: str
+        "square" (on for the first half of each cycle) or "sine" (sampled sinusoid)
+    max_frames: int
+        Longest sequence to generate
+
+    Returns
+    -------
+    levels: np.ndarray
+        Intensity of each frame
+    actual: float
+        Frequency the sequence has at refresh_rate
+    """
+    ratio = (Fraction(frequency).limit_denominator(10000) / Fraction(refresh_rate).limit_denominator(10000))
+    ratio = ratio.limit_denominator(max_frames)  # Cycles per frame
+    cycles = ratio.numerator * np.arange(ratio.denominator) / ratio.denominator + phase
+    if waveform == "sine":
+        levels = 0.5 * (1 + np.sin(2 * np.pi * cycles))
+    else:
+        levels = (cycles % 1 < 0.5).astype(np.float64)
+    return levels, float(ratio * Fraction(refresh_rate).limit_denominator(10000))
+
+
+def folder_name(frequency, phase):
+    """Folder of a sequence, named like the VideoStimulus assets (7_5-Hz), with the phase if not 0"""
+    name = f"{frequency:g}".replace(".", "_") + "-Hz"
+    return name + (f"_p{phase:g}".replace(".", "_") if phase else "")
+
+
+def write_sequence(path, levels, size, manifest):
+    """Write levels as PNG frames (1_on.png, 2_off.png, ... for square waves, 1.png, 2.png, ... otherwise)"""
+    os.makedirs(path, exist_ok=True)
+    square = manifest["waveform"] == "square"
+    for i, level in enumerate(levels, start=1):
+        gray = int(round(255 * level))
+        image = QImage(size[0], size[1], QImage.Format_RGB32)
+        image.fill(QColor(gray, gray, gray))
+        name = f"{i}_{'on' if level else 'off'}.png" if square else f"{i}.png"
+        if not image.save(os.path.join(path, name)):
+            raise OSError(f"Could not write {name}.")
+    with open(os.path.join(path, "sequence.json"), 'w') as f:
+        json.dump(dict(manifest, frames=len(levels), levels=[round(float(v), 4) for v in levels]), f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='framesequence.py',
+                                     description='Writes one folder of PNG frames per frequency, looping exactly at '
+                                                 'the given refresh rate, for the FramePlayer stimulus.')
+    parser.add_argument('frequencies', type=float, nargs='+', help="Flicker frequencies in Hz")
+    parser.add_argument('--phases', type=float, nargs='+', help="Phase of each frequency in cycles (default 0)")
+    parser.add_argument('--refresh', type=float, default=60, help="Monitor refresh rate in Hz")
+    parser.add_argument('--waveform', choices=["square", "sine"], default="square", help="On/off or sampled sinusoid")
+    parser.add_argument('--size', type=int, nargs=2, default=[400, 400], help="Frame width and height in pixels")
+    parser.add_argument('--max-frames', type=int, default=600, help="Longest sequence per frequency")
+    parser.add_argument('--out', default=os.getcwd(), help="Directory to write the sequence folders to")
+    args = parser.parse_args()
+
+    phases = args.phases or [0.0] * len(args.frequencies)
+    if len(phases) != len(args.frequencies):
+        sys.exit("Give one phase per frequency.")
+    for freq, phase in zip(args.frequencies, phases):
+        if not 0 < freq <= args.refresh / 2:
+            sys.exit(f"{freq} Hz cannot be shown at {args.refresh} Hz (limit {args.refresh / 2} Hz).")
+        levels, actual = frame_levels(freq, args.refresh, phase, args.waveform, args.max_frames)
+        if not actual:
+            sys.exit(f"{freq} Hz needs more than {args.max_frames} frames at {args.refresh} Hz (see --max-frames).")
+        path = os.path.join(args.out, folder_name(freq, phase))
+        write_sequence(path, levels, args.size, {"frequency": freq, "actual_frequency": actual, "phase": phase,
+                                                 "refresh_rate": args.refresh, "waveform": args.waveform})
+        print(f"{path}: {len(levels)} frames, {actual:.4f} Hz")
@@ -1,74 +1,63 @@
-"""Threaded SSVEP stimulus with GPU acceleration"""
+"""SSVEP stimulus drawn on one vsync-paced OpenGL surface"""
 import numpy as np
 import os
 import sys
 
-from PyQt5.QtWidgets import QApplication, QWidget, QGridLayout, QOpenGLWidget
-from PyQt5.QtCore import QThread, Qt, pyqtSignal
-from PyQt5.QtGui import QColor, QPainter, QBrush, QFont, QSurfaceFormat, QPalette
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QOpenGLWidget
+from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QColor, QPainter, QFont, QSurfaceFormat
+from time import perf_counter
 
-class FlashingThread(QThread):
-    flash_signal = pyqtSignal()
+class FlashGrid(QOpenGLWidget):
+    # One surface draws every box. Each swapped frame requests the next, so with a swap interval of 1 the grid is
+    # repainted once per display refresh, and each box's state is computed from the frame's time since the first
+    # frame instead of toggled by a sleeping thread.
+    margin = 9
+    spacing = 6
 
-    def __init__(self, frequency):
-        super().__init__()
-        self.frequency = frequency
-        self.is_running = True
-
-    def run(self):
-        interval = 1 / (2 * self.frequency)  # Calculate interval between flashes
-        while self.is_running:
-            self.flash_signal.emit()
-            QThread.msleep(int(1000 * interval))
-
-    def stop(self):
-        self.is_running = False
-
-class FlashingBox(QOpenGLWidget):
-    def __init__(self, frequency):
+    def __init__(self, frequencies, rows, cols):
         super().__init__()
-        self.frequency = frequency
-        self.flash_state = False
-        self.flashing_thread = FlashingThread(frequency)
-        self.flashing_thread.flash_signal.connect(self.toggle_flash)
-        self.flashing_thread.start()
-
-    def toggle_flash(self):
-        self.flash_state = not self.flash_state
-        self.update()
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.labels = [f'{f:.1f} Hz' for f in frequencies]
+        self.rows, self.cols = rows, cols
+        self.cells = []
+        self.start = None
+        self.frameSwapped.connect(self.update)
+
+    def resizeGL(self, w, h):
+        cw = (w - 2 * self.margin - (self.cols - 1) * self.spacing) / self.cols
+        ch = (h - 2 * self.margin - (self.rows - 1) * self.spacing) / self.rows
+        self.cells = [QRectF(self.margin + j * (cw + self.spacing), self.margin + i * (ch + self.spacing), cw, ch)
+                      for i in range(self.rows) for j in range(self.cols)][:len(self.frequencies)]
 
     def paintGL(self):
+        now = perf_counter()
+        if self.start is None:
+            self.start = now
+        # Same onset tolerance as Stimuli.FlashGrid, so both classify a frame on a half-period boundary alike
+        flash = ((now - self.start) * self.frequencies + 1e-9) % 1 < 0.5
+
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        color = QColor(Qt.black) if self.flash_state else QColor(Qt.white)
-        painter.setBrush(QBrush(color))
-        # painter.drawEllipse(self.rect())
-        painter.drawRect(self.rect())
-        painter.setPen(QColor(Qt.black) if not self.flash_state else QColor(Qt.white))
+        painter.fillRect(self.rect(), Qt.black)
         painter.setFont(QFont('Arial', 16))
-        painter.drawText(self.rect(), Qt.AlignCenter, f'{self.frequency:.1f} Hz')
-
-    def closeEvent(self, event):
-        self.flashing_thread.stop()
-        self.flashing_thread.wait()
+        for rect, label, on in zip(self.cells, self.labels, flash):
+            painter.fillRect(rect, Qt.black if on else Qt.white)
+            painter.setPen(QColor(Qt.white) if on else QColor(Qt.black))
+            painter.drawText(rect, Qt.AlignCenter, label)
+        painter.end()
 
 class SSVEPStimulus(QWidget):
     def __init__(self, frequencies, rows, cols):
         super().__init__()
-        layout = QGridLayout()
+        layout = QVBoxLayout()
         self.setLayout(layout)
         
         p = self.palette()
         p.setColor(self.backgroundRole(), Qt.black)
         self.setPalette(p)
 
-        n = 0
-        for i in range(rows):
-            for j in range(cols):
-                if n < len(frequencies):
-                    box = FlashingBox(frequencies[n])
-                    layout.addWidget(box, i, j)
-                    n += 1
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(FlashGrid(frequencies, rows, cols))
 
     def keyPressEvent(self, event):
         # Close the stimulus when the escape key is pressed
@@ -95,4 +84,4 @@ if __name__ == "__main__":
     stimulus = SSVEPStimulus(frequencies, rows, cols)
     stimulus.showFullScreen()
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
@@ -16,6 +16,7 @@ DATA_TABLE = "Data Table"
 HPARAMS = ("SampleRate", "HeadsetConfiguration", "HeadsetModel", "BufferSize")
 SPARAMS = ("ProjectName", "SubjectName", "ResponseType", "StimulusType",
            "BlockLength", "BlockCount", "StimCycle")
+PARAM_BLOCKS = ("SessionParams", "HardwareParams")  # Fields keep their own names as Info Table columns
 
 
 def verify_json(json: dict):
@@ -53,16 +54,20 @@ def dictify(annotations):
     return out
 
 
-def flatten(dct):
+def flatten(dct, prefix=""):
+    """
+    Flatten info.json into one Info Table row. Fields of blocks other than PARAM_BLOCKS are prefixed with their
+    parent keys (AcquisitionSummary_board0_Samples), so blocks with the same field names do not overwrite each other.
+    """
     flat = {}
     for key, val in dct.items():
+        name = prefix + key
         if isinstance(val, dict):
-            for k, v in flatten(val).items():
-                flat[k] = v
+            flat.update(flatten(val, "" if not prefix and key in PARAM_BLOCKS else name + "_"))
         elif isinstance(val, list):
-            flat[key] = str(dictify(val)).replace("'", '"')
+            flat[name] = str(dictify(val)).replace("'", '"')
         else:
-            flat[key] = val
+            flat[name] = val
     return flat
 
 